@@ -0,0 +1,185 @@
+"""Аутентификация по токену с кешем снимков пользователя.
+
+TokenAuthentication на каждый запрос читает Token и User одним JOIN.
+CachedTokenAuthentication сначала ищет снимок в LRU процесса
+(AUTH_TOKEN_LOCAL_TTL секунд), затем в общем кеше Django
+(AUTH_TOKEN_CACHE_TTL), и только потом идёт в БД. В снимке лежат поля
+SNAPSHOT_FIELDS; остальные поля пользователя (пароль, счётчики)
+загружаются при первом обращении, как после .only().
+
+Снимки сбрасывают сигналы api.signals: при удалении токена (выход через
+token/logout, удаление пользователя) и при сохранении пользователя
+(смена пароля, блокировка, правка профиля). Общий кеш и LRU текущего
+процесса сбрасываются сразу; другие процессы видят изменение не позже
+чем через AUTH_TOKEN_LOCAL_TTL секунд. Вместо снимка на REVOKED_TTL
+записывается отметка, чтобы запрос, прочитавший БД до изменения,
+не вернул устаревший снимок в кеш."""
+import hashlib
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from users.models import User
+
+SNAPSHOT_FIELDS = (
+    'id',
+    'email',
+    'username',
+    'first_name',
+    'last_name',
+    'is_active',
+    'is_staff',
+    'is_superuser',
+)
+# Поля, при изменении которых снимок сбрасывается.
+TRACKED_FIELDS = {*SNAPSHOT_FIELDS, 'password'}
+TOKEN_KEY = 'auth:token:{digest}'
+REVOKED = 'revoked'
+REVOKED_TTL = 60
+# Счётчики копятся в процессе и сбрасываются в общий кеш раз в
+# STATS_FLUSH_EVERY проверок, чтобы не писать в кеш на каждый запрос.
+STATS_FLUSH_EVERY = 100
+STATS_KEY = 'auth:token:stats:{name}'
+STATS = ('local_hits', 'shared_hits', 'misses')
+
+_local = OrderedDict()
+_lock = threading.Lock()
+_pending = Counter()
+
+
+def token_key(key):
+    return TOKEN_KEY.format(digest=hashlib.sha256(key.encode()).hexdigest())
+
+
+def get_local(cache_key):
+    with _lock:
+        entry = _local.get(cache_key)
+        if entry is None:
+            return None
+        expires, snapshot = entry
+        if expires < time.monotonic():
+            del _local[cache_key]
+            return None
+        _local.move_to_end(cache_key)
+        return snapshot
+
+
+def set_local(cache_key, snapshot):
+    with _lock:
+        _local[cache_key] = (
+            time.monotonic() + settings.AUTH_TOKEN_LOCAL_TTL, snapshot
+        )
+        _local.move_to_end(cache_key)
+        while len(_local) > settings.AUTH_TOKEN_LOCAL_SIZE:
+            _local.popitem(last=False)
+
+
+def make_snapshot(token):
+    return {
+        'user': {
+            field: getattr(token.user, field) for field in SNAPSHOT_FIELDS
+        },
+        'created': token.created,
+    }
+
+
+def from_snapshot(key, snapshot):
+    """Пользователь и токен из снимка. Пользователь создаётся заново
+    на каждый запрос: представления могут его менять."""
+    fields = snapshot['user']
+    # from_db ждёт значения в порядке полей модели.
+    names = [
+        field.attname for field in User._meta.concrete_fields
+        if field.attname in fields
+    ]
+    user = User.from_db(
+        User.objects.db, names, [fields[name] for name in names]
+    )
+    token = Token.from_db(
+        Token.objects.db,
+        ['key', 'user_id', 'created'],
+        [key, user.pk, snapshot['created']],
+    )
+    token.user = user
+    return user, token
+
+
+def count(name):
+    with _lock:
+        _pending[name] += 1
+        if sum(_pending.values()) < STATS_FLUSH_EVERY:
+            return
+        pending = dict(_pending)
+        _pending.clear()
+    flush_stats(pending)
+
+
+def flush_stats(pending):
+    for name, value in pending.items():
+        key = STATS_KEY.format(name=name)
+        if not cache.add(key, value, None):
+            try:
+                cache.incr(key, value)
+            except ValueError:
+                cache.add(key, value, None)
+
+
+def get_stats():
+    """Счётчики всех процессов из общего кеша вместе с ещё не
+    сброшенными счётчиками текущего процесса."""
+    with _lock:
+        pending = dict(_pending)
+    stored = cache.get_many([STATS_KEY.format(name=name) for name in STATS])
+    stats = {
+        name: stored.get(STATS_KEY.format(name=name), 0)
+        + pending.get(name, 0)
+        for name in STATS
+    }
+    total = sum(stats.values())
+    hits = stats['local_hits'] + stats['shared_hits']
+    stats['hit_ratio'] = hits / total if total else 0.0
+    stats['local_hit_ratio'] = stats['local_hits'] / total if total else 0.0
+    return stats
+
+
+def invalidate_tokens(keys):
+    """Сбрасывает снимки токенов keys."""
+    cache_keys = [token_key(key) for key in keys]
+    if not cache_keys:
+        return
+    with _lock:
+        for cache_key in cache_keys:
+            _local.pop(cache_key, None)
+    cache.set_many(
+        {cache_key: REVOKED for cache_key in cache_keys}, REVOKED_TTL
+    )
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, который берёт пользователя из кеша.
+    Снимки сохраняются только для верных токенов активных
+    пользователей; остальные токены всегда проверяются по БД."""
+
+    def authenticate_credentials(self, key):
+        cache_key = token_key(key)
+        snapshot = get_local(cache_key)
+        if snapshot is not None:
+            count('local_hits')
+            return from_snapshot(key, snapshot)
+        snapshot = cache.get(cache_key)
+        if isinstance(snapshot, dict):
+            count('shared_hits')
+            set_local(cache_key, snapshot)
+            return from_snapshot(key, snapshot)
+        count('misses')
+        user, token = super().authenticate_credentials(key)
+        if snapshot != REVOKED:
+            snapshot = make_snapshot(token)
+            if cache.add(cache_key, snapshot, settings.AUTH_TOKEN_CACHE_TTL):
+                set_local(cache_key, snapshot)
+        return user, token
@@ -0,0 +1,119 @@
+"""Индекс ингредиентов в памяти процесса для автодополнения.
+
+Справочник ингредиентов небольшой и меняется редко, поэтому запросы
+/api/ingredients/?name=... обслуживаются без обращения к БД.
+Версия справочника берётся из самой БД: число ингредиентов и время
+последнего изменения (Ingredient.updated). Каждый процесс сверяет её
+не чаще раза в VERSION_CHECK_INTERVAL секунд и перестраивает индекс,
+если она изменилась, кто бы ни менял справочник: другой воркер,
+загрузчик ингредиентов или админка. Сигналы этого процесса заставляют
+сверить версию сразу."""
+import threading
+import time
+from bisect import bisect_left
+
+from django.db.models import Count, Max
+
+from recipes.models import Ingredient
+
+GRAM_SIZE = 2
+VERSION_CHECK_INTERVAL = 5
+
+
+def get_ingredients_version():
+    version = Ingredient.objects.aggregate(
+        count=Count('pk'), updated=Max('updated')
+    )
+    return version['count'], version['updated']
+
+
+class IngredientIndex:
+    """Отсортированные по названию ингредиенты и инвертированный индекс
+    символов и пар символов их названий в нижнем регистре."""
+
+    def __init__(self, rows):
+        entries = sorted(
+            (name.lower(), pk, name, measurement_unit)
+            for pk, name, measurement_unit in rows
+        )
+        self.keys = [key for key, *_ in entries]
+        self.items = [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, pk, name, measurement_unit in entries
+        ]
+        self.postings = {}
+        for index, key in enumerate(self.keys):
+            grams = set(key) | {key[i:i + 2] for i in range(len(key) - 1)}
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(index)
+
+    def candidates(self, query):
+        """Номера названий, которые могут содержать query, и признак,
+        нужна ли их проверка: для коротких запросов список точный,
+        для длинных берётся самая редкая пара символов запроса."""
+        if len(query) <= GRAM_SIZE:
+            return self.postings.get(query, ()), False
+        grams = {query[i:i + 2] for i in range(len(query) - 1)}
+        return min(
+            (self.postings.get(gram, ()) for gram in grams), key=len
+        ), True
+
+    def search(self, query):
+        """Сначала ингредиенты, начинающиеся с query, затем содержащие
+        его в середине названия. Регистр не учитывается."""
+        query = query.strip().lower()
+        if not query:
+            return list(self.items)
+        start = bisect_left(self.keys, query)
+        end = start
+        while end < len(self.keys) and self.keys[end].startswith(query):
+            end += 1
+        candidates, check = self.candidates(query)
+        keys = self.keys
+        return self.items[start:end] + [
+            self.items[index] for index in candidates
+            if not start <= index < end and (not check or query in keys[index])
+        ]
+
+
+class IngredientAutocomplete:
+    """Индекс текущей версии справочника, общий для потоков процесса."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.index = None
+        self.checked = None
+
+    def is_fresh(self):
+        return self.index is not None and self.checked is not None and (
+            time.monotonic() - self.checked < VERSION_CHECK_INTERVAL
+        )
+
+    def get_index(self):
+        if self.is_fresh():
+            return self.index
+        with self.lock:
+            if self.is_fresh():
+                return self.index
+            version = get_ingredients_version()
+            if self.index is None or self.version != version:
+                self.index = IngredientIndex(
+                    Ingredient.objects.values_list(
+                        'pk', 'name', 'measurement_unit'
+                    ).iterator()
+                )
+                self.version = version
+            self.checked = time.monotonic()
+        return self.index
+
+    def search(self, query):
+        return self.get_index().search(query)
+
+
+ingredient_autocomplete = IngredientAutocomplete()
+
+
+def invalidate_ingredients():
+    """Сверить версию справочника при следующем запросе к индексу."""
+    ingredient_autocomplete.checked = None
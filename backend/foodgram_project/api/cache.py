@@ -0,0 +1,146 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+# Увеличивается при изменении формата ответов рецептов, чтобы
+# не отдавать закешированные фрагменты и ответы прежнего вида.
+RESPONSE_FORMAT = 2
+RECIPE_LIST_VERSION_KEY = 'recipes:list:version'
+RECIPE_VERSION_KEY = 'recipes:{pk}:version'
+RECIPE_FRAGMENT_KEY = f'recipes:{{pk}}:fragment:{RESPONSE_FORMAT}'
+HITS_KEY = 'recipes:cache:hits'
+MISSES_KEY = 'recipes:cache:misses'
+
+
+def get_version(key):
+    """Текущая версия набора данных.
+
+    Версия хранится в том же кеше, что и ответы. Если её там нет
+    (первое обращение, сброс или вытеснение), заводится новая по текущему
+    времени, чтобы ключи старых ответов больше не совпадали."""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_recipes(recipe_ids=()):
+    """Сбрасывает версии списка рецептов и указанных рецептов."""
+    keys = [RECIPE_VERSION_KEY.format(pk=pk) for pk in recipe_ids]
+    cache.delete_many([RECIPE_LIST_VERSION_KEY, *keys])
+
+
+def normalize_query(request):
+    params = sorted(
+        (key, sorted(value for value in values if value))
+        for key, values in request.query_params.lists()
+    )
+    query = '&'.join(
+        f'{key}={",".join(values)}' for key, values in params if values
+    )
+    return hashlib.md5(query.encode()).hexdigest()
+
+
+def recipe_list_key(request):
+    return 'recipes:list:{format}:{host}:{version}:{query}'.format(
+        format=RESPONSE_FORMAT,
+        host=request.get_host(),
+        version=get_version(RECIPE_LIST_VERSION_KEY),
+        query=normalize_query(request),
+    )
+
+
+def recipe_detail_key(request, pk):
+    return 'recipes:detail:{format}:{host}:{pk}:{version}'.format(
+        format=RESPONSE_FORMAT,
+        host=request.get_host(),
+        pk=pk,
+        version=get_version(RECIPE_VERSION_KEY.format(pk=pk)),
+    )
+
+
+def get_recipe_fragments(recipes, render):
+    """Не зависящие от пользователя части представлений рецептов.
+
+    Фрагменты и версии рецептов читаются одним get_many. Фрагмент
+    действителен, если записанная в нём версия совпадает с текущей.
+    Недостающие фрагменты строит render(recipes) одним проходом и
+    сохраняет под версией, прочитанной до построения. RECIPE_CACHE_TIMEOUT
+    только вытесняет давно не запрашиваемые фрагменты."""
+    version_keys = {
+        recipe.pk: RECIPE_VERSION_KEY.format(pk=recipe.pk)
+        for recipe in recipes
+    }
+    fragment_keys = {
+        recipe.pk: RECIPE_FRAGMENT_KEY.format(pk=recipe.pk)
+        for recipe in recipes
+    }
+    cached = cache.get_many([*version_keys.values(), *fragment_keys.values()])
+    fragments = {}
+    missing = []
+    for recipe in recipes:
+        version = cached.get(version_keys[recipe.pk])
+        entry = cached.get(fragment_keys[recipe.pk])
+        if version is not None and entry and entry['version'] == version:
+            fragments[recipe.pk] = entry['data']
+        else:
+            missing.append(recipe)
+    if not missing:
+        return fragments
+    versions = {
+        recipe.pk: (
+            cached.get(version_keys[recipe.pk])
+            or get_version(version_keys[recipe.pk])
+        )
+        for recipe in missing
+    }
+    rendered = dict(zip((recipe.pk for recipe in missing), render(missing)))
+    cache.set_many({
+        fragment_keys[pk]: {'version': versions[pk], 'data': data}
+        for pk, data in rendered.items()
+    }, settings.RECIPE_CACHE_TIMEOUT)
+    fragments.update(rendered)
+    return fragments
+
+
+def count(key):
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 1, None)
+
+
+def get_stats():
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else 0.0,
+    }
+
+
+def cached_response(key, render):
+    """Отдаёт сохранённый ответ по ключу или строит его через render().
+
+    Ответы устаревают только при смене версии, которую сбрасывают
+    сигналы при изменении рецептов. RECIPE_CACHE_TIMEOUT лишь вытесняет
+    давно не запрашиваемые ответы."""
+    data = cache.get(key)
+    if data is not None:
+        count(HITS_KEY)
+        response = Response(data)
+        response['X-Cache'] = 'HIT'
+        return response
+    count(MISSES_KEY)
+    response = render()
+    if response.status_code == 200:
+        cache.set(key, response.data, settings.RECIPE_CACHE_TIMEOUT)
+    response['X-Cache'] = 'MISS'
+    return response
@@ -0,0 +1,107 @@
+"""Выгрузка списка покупок в txt, CSV и PDF.
+
+Строки читаются из БД итератором и отдаются потоком, так что память
+не растёт с длиной списка: в txt и CSV каждая строка сразу становится
+куском ответа, в PDF — каждая страница (см. api.pdf)."""
+import csv
+import os
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+from api.pdf import PdfWriter
+from recipes.models import ShoppingCartItem
+
+SPOOL_SIZE = 1024 * 1024
+TITLE = 'Список покупок:'
+CSV_HEADER = ('Ингредиент', 'Количество', 'Единица измерения')
+
+PDF_FONT = 'ShoppingListFont'
+PDF_FALLBACK_FONT = 'Helvetica'
+PDF_FONT_SIZE = 12
+PDF_TITLE_SIZE = 16
+PDF_MARGIN = 50
+PDF_LINE_HEIGHT = 18
+
+
+def shopping_list_rows(user):
+    """Ингредиенты из списка покупок с суммарным количеством."""
+    return ShoppingCartItem.objects.filter(user=user).values_list(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        'amount',
+    ).order_by('ingredient__name', 'ingredient__measurement_unit').iterator()
+
+
+def write_txt(rows):
+    yield f'{TITLE}\n'.encode()
+    for name, measurement_unit, amount in rows:
+        yield f'- {name} - {amount} {measurement_unit}\n'.encode()
+
+
+class Echo:
+    """Буфер для csv.writer, который возвращает записанное."""
+
+    def write(self, value):
+        return value
+
+
+def write_csv(rows):
+    writer = csv.writer(Echo())
+    yield ('\ufeff' + writer.writerow(CSV_HEADER)).encode()
+    for name, measurement_unit, amount in rows:
+        yield writer.writerow((name, amount, measurement_unit)).encode()
+
+
+def get_pdf_font():
+    if PDF_FONT in pdfmetrics.getRegisteredFontNames():
+        return PDF_FONT
+    if not os.path.exists(settings.SHOPPING_LIST_PDF_FONT):
+        return PDF_FALLBACK_FONT
+    pdfmetrics.registerFont(TTFont(PDF_FONT, settings.SHOPPING_LIST_PDF_FONT))
+    return PDF_FONT
+
+
+def write_pdf(rows):
+    """PDF отдаётся постранично: страница уходит клиенту, как только на
+    неё легли все строки, и в памяти держится одна страница."""
+    _, height = A4
+    writer = PdfWriter(get_pdf_font(), A4)
+    yield writer.start()
+    lines = [(PDF_MARGIN, height - PDF_MARGIN, PDF_TITLE_SIZE, TITLE)]
+    y = height - PDF_MARGIN - 2 * PDF_LINE_HEIGHT
+    for name, measurement_unit, amount in rows:
+        if y < PDF_MARGIN:
+            yield writer.page(lines)
+            lines = []
+            y = height - PDF_MARGIN
+        lines.append((
+            PDF_MARGIN,
+            y,
+            PDF_FONT_SIZE,
+            f'• {name} — {amount} {measurement_unit}',
+        ))
+        y -= PDF_LINE_HEIGHT
+    yield writer.page(lines)
+    yield writer.finish()
+
+
+EXPORTS = {
+    'txt': (write_txt, 'text/plain; charset=utf-8'),
+    'csv': (write_csv, 'text/csv; charset=utf-8'),
+    'pdf': (write_pdf, 'application/pdf'),
+}
+
+
+def shopping_list_response(user, export_format):
+    writer, content_type = EXPORTS[export_format]
+    response = StreamingHttpResponse(
+        writer(shopping_list_rows(user)), content_type=content_type
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_list.{export_format}"'
+    )
+    return response
@@ -1,7 +1,17 @@
+from django.db.models import Exists, F, OuterRef
 from django_filters import rest_framework as filters
 from django_filters.rest_framework import FilterSet
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingList, Tag
+from recipes.search import search_recipes
+from recipes.tags import tags_mask
+
+TAGS_MODE_ANY = 'any'
+TAGS_MODE_ALL = 'all'
+TAGS_MODES = (
+    (TAGS_MODE_ANY, 'Любой из тегов'),
+    (TAGS_MODE_ALL, 'Все теги'),
+)
 
 
 class IngredientFilter(FilterSet):
@@ -12,29 +22,80 @@ class IngredientFilter(FilterSet):
 
 
 class RecipeFilter(FilterSet):
-    """Фильтр рецептов."""
+    """Фильтр рецептов.
+
+    Каждое условие сужает один и тот же queryset, поэтому фильтры
+    комбинируются. Теги и пользовательские списки проверяются через
+    EXISTS, чтобы JOIN не размножал строки рецептов."""
     tags = filters.ModelMultipleChoiceFilter(
         field_name='tags__slug', to_field_name='slug',
-        queryset=Tag.objects.all())
+        queryset=Tag.objects.all(), method='filter_tags')
+    tags_mode = filters.ChoiceFilter(
+        choices=TAGS_MODES, method='filter_tags_mode'
+    )
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'search',
+            'tags',
+            'tags_mode',
+            'author',
+            'is_favorited',
+            'is_in_shopping_cart',
+        )
+
+    def filter_tags(self, queryset, name, value):
+        """Теги проверяются по битовой маске рецепта без JOIN.
+        В режиме tags_mode=all рецепт должен иметь все выбранные теги.
+        Если у какого-то тега нет бита, используется EXISTS."""
+        if not value:
+            return queryset
+        match_all = self.form.cleaned_data.get('tags_mode') == TAGS_MODE_ALL
+        mask = tags_mask(value)
+        if mask is None:
+            through = Recipe.tags.through.objects
+            if not match_all:
+                return queryset.filter(Exists(
+                    through.filter(recipe=OuterRef('pk'), tag__in=value)
+                ))
+            for tag in value:
+                queryset = queryset.filter(Exists(
+                    through.filter(recipe=OuterRef('pk'), tag=tag)
+                ))
+            return queryset
+        queryset = queryset.annotate(
+            tags_matched=F('tags_mask').bitand(mask)
+        )
+        if match_all:
+            return queryset.filter(tags_matched=mask)
+        return queryset.filter(tags_matched__gt=0)
+
+    def filter_tags_mode(self, queryset, name, value):
+        return queryset
 
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
-        recipes = Recipe.objects.all()
         if user.is_authenticated and value:
-            return Recipe.objects.filter(favorites__user=user)
-        return recipes
+            return queryset.filter(Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ))
+        return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         user = self.request.user
-        recipes = Recipe.objects.all()
         if user.is_authenticated and value:
-            return Recipe.objects.filter(shopping__user=user)
-        return recipes
+            return queryset.filter(Exists(
+                ShoppingList.objects.filter(user=user, recipe=OuterRef('pk'))
+            ))
+        return queryset
+
+    def filter_search(self, queryset, name, value):
+        """Полнотекстовый поиск по названию, описанию и ингредиентам.
+        Результаты упорядочены по убыванию релевантности."""
+        return search_recipes(queryset, value)
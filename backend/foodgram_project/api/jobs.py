@@ -0,0 +1,39 @@
+"""Фоновые задачи API (см. jobs.queue)."""
+import tempfile
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+from api.exports import EXPORTS, SPOOL_SIZE, shopping_list_rows
+from jobs.queue import enqueue, register
+
+EXPORTS_DIR = 'shopping_lists'
+
+
+@register('api.shopping_list_export')
+def shopping_list_export(user_id, export_format):
+    """Выгружает список покупок в файл хранилища; через
+    SHOPPING_LIST_EXPORT_TTL часов файл удаляется."""
+    writer, _ = EXPORTS[export_format]
+    with tempfile.SpooledTemporaryFile(SPOOL_SIZE) as file:
+        for chunk in writer(shopping_list_rows(user_id)):
+            file.write(chunk)
+        file.seek(0)
+        path = default_storage.save(
+            f'{EXPORTS_DIR}/{user_id}/{uuid.uuid4().hex}.{export_format}',
+            File(file),
+        )
+    enqueue(
+        'api.delete_export',
+        {'path': path},
+        delay=timedelta(hours=settings.SHOPPING_LIST_EXPORT_TTL),
+    )
+    return {'path': path}
+
+
+@register('api.delete_export')
+def delete_export(path):
+    default_storage.delete(path)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.authentication import get_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает счётчики попаданий в кеш аутентификации по токену.'
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        self.stdout.write(
+            'local hits: {local_hits}, shared hits: {shared_hits}, '
+            'misses: {misses}, hit ratio: {hit_ratio:.2%} '
+            '(local: {local_hit_ratio:.2%})'.format(**stats)
+        )
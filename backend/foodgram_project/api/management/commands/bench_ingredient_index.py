@@ -0,0 +1,56 @@
+import csv
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.autocomplete import IngredientIndex, ingredient_autocomplete
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время поиска в индексе автодополнения ингредиентов '
+            'и выводит перцентили.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--csv',
+            help='Построить индекс из CSV (name,measurement_unit) вместо БД.',
+        )
+        parser.add_argument('--lookups', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['csv']:
+            with open(options['csv'], encoding='utf-8') as file:
+                rows = [
+                    (pk, name, unit)
+                    for pk, (name, unit) in enumerate(csv.reader(file), 1)
+                ]
+            index = IngredientIndex(rows)
+        else:
+            index = ingredient_autocomplete.get_index()
+        if not index.keys:
+            self.stdout.write('Справочник ингредиентов пуст.')
+            return
+        rng = random.Random(options['seed'])
+        queries = []
+        for _ in range(options['lookups']):
+            key = rng.choice(index.keys)
+            start = rng.randrange(len(key)) if rng.random() < 0.3 else 0
+            queries.append(key[start:start + rng.randint(1, 4)])
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+
+        def percentile(value):
+            return timings[min(len(timings) - 1, int(len(timings) * value))]
+
+        self.stdout.write(
+            f'ингредиентов: {len(index.keys)}, запросов: {len(timings)}\n'
+            f'p50: {percentile(0.5):.3f} мс, '
+            f'p99: {percentile(0.99):.3f} мс, '
+            f'max: {timings[-1]:.3f} мс'
+        )
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.uploads import clear_uploads
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки, загруженные через /api/recipes/images/ '
+            'и не использованные ни в одном рецепте.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=settings.RECIPE_IMAGE_UPLOAD_TTL,
+            help='Возраст загрузки в часах, после которого она удаляется.',
+        )
+
+    def handle(self, *args, **options):
+        removed = clear_uploads(
+            timezone.now() - timedelta(hours=options['hours'])
+        )
+        self.stdout.write(f'удалено загрузок: {removed}')
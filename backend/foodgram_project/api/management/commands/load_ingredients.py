@@ -0,0 +1,155 @@
+import csv
+import io
+import json
+import os
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.snapshots import build_snapshot
+from recipes.models import Ingredient
+
+BATCH_SIZE = 5000
+CHUNK_SIZE = 64 * 1024
+CSV_HEADER = ['name', 'measurement_unit']
+FORMATS = ('csv', 'json')
+
+COPY_TABLE = 'ingredients_load'
+CREATE_COPY_TABLE_SQL = (
+    f'CREATE TEMPORARY TABLE {COPY_TABLE} '
+    '(name varchar(200), measurement_unit varchar(200)) ON COMMIT DROP'
+)
+COPY_SQL = f'COPY {COPY_TABLE} FROM STDIN WITH (FORMAT csv)'
+INSERT_FROM_COPY_SQL = (
+    'INSERT INTO recipes_ingredient '
+    '(name, measurement_unit, amount, updated) '
+    f'SELECT DISTINCT name, measurement_unit, %s, now() FROM {COPY_TABLE} '
+    'ON CONFLICT (name, measurement_unit) DO NOTHING'
+)
+
+
+def read_csv(file):
+    for line, row in enumerate(csv.reader(file), 1):
+        if not row or line == 1 and row == CSV_HEADER:
+            continue
+        if len(row) != 2:
+            raise CommandError(f'Строка {line}: ожидается два столбца.')
+        yield row[0].strip(), row[1].strip()
+
+
+def read_json(file):
+    """Элементы JSON-массива объектов, разбираемые по мере чтения файла."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив объектов.')
+    position = 1
+    end_of_file = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if buffer[position:position + 1] == ']':
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as error:
+            if end_of_file:
+                raise CommandError(f'Некорректный JSON: {error}')
+            chunk = file.read(CHUNK_SIZE)
+            end_of_file = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        try:
+            yield item['name'].strip(), item['measurement_unit'].strip()
+        except (KeyError, TypeError, AttributeError):
+            raise CommandError(f'Некорректный элемент: {item!r}')
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    batch = list(islice(rows, size))
+    while batch:
+        yield batch
+        batch = list(islice(rows, size))
+
+
+class Command(BaseCommand):
+    help = ('Загружает ингредиенты из CSV (name,measurement_unit) или JSON. '
+            'Уже существующие пары название/единица пропускаются, поэтому '
+            'команду можно запускать повторно.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу с ингредиентами.')
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Формат файла; по умолчанию определяется по расширению.',
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = (
+            options['format'] or os.path.splitext(path)[1][1:].lower()
+        )
+        if file_format not in FORMATS:
+            raise CommandError('Не удалось определить формат, укажите '
+                               '--format csv или --format json.')
+        reader = read_csv if file_format == 'csv' else read_json
+        started = time.perf_counter()
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as file:
+                with transaction.atomic():
+                    if connection.vendor == 'postgresql':
+                        read, created = self.copy(
+                            reader(file), options['batch_size']
+                        )
+                    else:
+                        read, created = self.bulk_create(
+                            reader(file), options['batch_size']
+                        )
+        except OSError as error:
+            raise CommandError(error)
+        elapsed = time.perf_counter() - started
+        if created:
+            # Индексы автодополнения веб-процессов увидят новые строки
+            # по версии справочника в БД, снимок — по файлу с хешем.
+            build_snapshot('ingredients')
+        self.stdout.write(
+            f'прочитано: {read}, добавлено: {created}, '
+            f'время: {elapsed:.2f} с, '
+            f'строк в секунду: {read / elapsed if elapsed else 0:.0f}'
+        )
+
+    def bulk_create(self, rows, batch_size):
+        before = Ingredient.objects.count()
+        read = 0
+        for batch in batches(rows, batch_size):
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(name=name, measurement_unit=measurement_unit)
+                    for name, measurement_unit in batch
+                ),
+                ignore_conflicts=True,
+            )
+            read += len(batch)
+        return read, Ingredient.objects.count() - before
+
+    def copy(self, rows, batch_size):
+        """Загрузка через COPY во временную таблицу и один INSERT
+        с пропуском конфликтов по (name, measurement_unit)."""
+        read = 0
+        with connection.cursor() as cursor:
+            cursor.execute(CREATE_COPY_TABLE_SQL)
+            for batch in batches(rows, batch_size):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(COPY_SQL, buffer)
+                read += len(batch)
+            cursor.execute(INSERT_FROM_COPY_SQL, [settings.MIN_VALUE])
+            return read, cursor.rowcount
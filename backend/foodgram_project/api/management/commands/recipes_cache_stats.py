@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import get_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает счётчики попаданий в кеш анонимных ответов рецептов.'
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        self.stdout.write(
+            'hits: {hits}, misses: {misses}, '
+            'hit ratio: {hit_ratio:.2%}'.format(**stats)
+        )
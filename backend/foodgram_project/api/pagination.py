@@ -1,9 +1,189 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 NUMBER: int = 6
 
 
+def estimate_count(queryset):
+    """Оценка числа строк таблицы по статистике планировщика PostgreSQL.
+
+    Возвращает None, если оценка неприменима: набор отфильтрован,
+    база не PostgreSQL или таблица ещё не анализировалась."""
+    if not isinstance(queryset, QuerySet):
+        return None
+    query = queryset.query
+    if query.where or query.distinct or query.is_sliced:
+        return None
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [connection.ops.quote_name(queryset.model._meta.db_table)],
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор, который для больших наборов без фильтров берёт оценку
+    количества вместо COUNT(*). Точный подсчёт выполняется, только если
+    оценка меньше PAGINATION_EXACT_COUNT_THRESHOLD."""
+    count_is_exact = True
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if (
+            estimate is not None
+            and estimate >= settings.PAGINATION_EXACT_COUNT_THRESHOLD
+        ):
+            self.count_is_exact = False
+            return estimate
+        return super().count
+
+
 class CustomPagination(PageNumberPagination):
-    """"Пагинация."""
+    """"Пагинация.
+
+    По умолчанию постраничная: параметры page и limit.
+    Если представление объявляет cursor_ordering, а в запросе передан
+    параметр cursor (пустой для первой страницы), включается пагинация
+    по ключу: следующая страница выбирается условием
+    (created, id) < (значения последнего рецепта) по индексу, без COUNT(*)
+    и OFFSET, поэтому время ответа не зависит от номера страницы.
+    Представление с cursor_only = True пагинируется только по ключу.
+    В постраничном режиме count для больших наборов без фильтров
+    может быть оценкой, об этом сообщает поле count_exact."""
+    django_paginator_class = EstimatedCountPaginator
     page_size = NUMBER
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = getattr(view, 'cursor_ordering', None)
+        self.use_cursor = bool(self.ordering) and (
+            getattr(view, 'cursor_only', False)
+            or self.cursor_query_param in request.query_params
+        )
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset)
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(position))
+        results = list(queryset[:page_size + 1])
+        self.next_position = None
+        if len(results) > page_size:
+            results = results[:page_size]
+            self.next_position = self.get_position(results[-1])
+        return results
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            paginator = self.page.paginator
+            return Response(OrderedDict([
+                ('count', paginator.count),
+                ('count_exact', paginator.count_is_exact),
+                ('next', self.get_next_link()),
+                ('previous', self.get_previous_link()),
+                ('results', data),
+            ]))
+        return Response(OrderedDict([
+            ('next', self.get_next_cursor_link()),
+            ('results', data),
+        ]))
+
+    def get_keyset_filter(self, position):
+        """Условие «строка идёт после позиции» для составного ключа."""
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def get_position(self, instance):
+        return [
+            getattr(instance, field.lstrip('-')) for field in self.ordering
+        ]
+
+    def encode_cursor(self, position):
+        data = json.dumps(position, default=str).encode()
+        return base64.urlsafe_b64encode(data).decode()
+
+    @staticmethod
+    def get_cursor_field(queryset, name):
+        """Поле ключа: аннотация запроса (например, search_rank)
+        или поле модели."""
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(name)
+
+    def decode_cursor(self, request, queryset):
+        """Позиция из параметра cursor. Значения приводятся к типам
+        полей ключа; любой испорченный курсор даёт 404."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (binascii.Error, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if (
+            not isinstance(position, list)
+            or len(position) != len(self.ordering)
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            position = [
+                self.get_cursor_field(
+                    queryset, field.lstrip('-')
+                ).to_python(value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (FieldDoesNotExist, ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        for value in position:
+            if value is None or (
+                isinstance(value, datetime)
+                and settings.USE_TZ and timezone.is_naive(value)
+            ):
+                raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def get_next_cursor_link(self):
+        if self.next_position is None:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param
+        )
+        return replace_query_param(
+            url, self.cursor_query_param,
+            self.encode_cursor(self.next_position)
+        )
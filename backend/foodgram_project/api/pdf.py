@@ -0,0 +1,196 @@
+"""Постраничная запись PDF.
+
+Canvas из ReportLab держит все страницы в памяти и пишет документ
+только в save(). PdfWriter отдаёт байты каждой страницы сразу после её
+отрисовки: объекты PDF могут идти в файле в любом порядке, если в конце
+есть таблица их смещений. В конце пишутся шрифты (их подмножество
+известно только после последней страницы), дерево страниц и эта
+таблица; страницы ссылаются на словарь шрифтов, записанный позже.
+
+Умеет ровно то, что нужно выгрузкам: строки текста одним шрифтом.
+Шрифты берутся из pdfmetrics: TrueType встраивается подмножествами
+по 256 символов, как это делает ReportLab, стандартные шрифты пишутся
+в WinAnsiEncoding."""
+import zlib
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import (FF_NONSYMBOLIC,
+                                       FF_SYMBOLIC,
+                                       SUBSETN,
+                                       makeToUnicodeCMap,
+                                       )
+
+HEADER = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+CATALOG = 1
+PAGES = 2
+FONTS = 3
+STANDARD_ENCODING = 'cp1252'
+
+
+def ref(number):
+    return f'{number} 0 R'
+
+
+def dictionary(entries):
+    return '<< {} >>'.format(' '.join(
+        f'/{key} {value}' for key, value in entries.items()
+    )).encode()
+
+
+def pdf_number(value):
+    return f'{value:g}'
+
+
+class PdfWriter:
+    """Пишет PDF по частям: start(), page() на каждую страницу,
+    finish(). Каждый вызов возвращает байты, которые можно сразу
+    отдавать клиенту."""
+
+    def __init__(self, font_name, pagesize):
+        self.font = pdfmetrics.getFont(font_name)
+        self.dynamic = getattr(self.font, '_dynamicFont', False)
+        self.width, self.height = pagesize
+        self.offset = 0
+        self.offsets = {}
+        self.count = FONTS
+        self.pages = []
+
+    def write(self, data):
+        self.offset += len(data)
+        return data
+
+    def reserve(self):
+        self.count += 1
+        return self.count
+
+    def object(self, pk, body):
+        self.offsets[pk] = self.offset
+        return self.write(b'%d 0 obj\n%s\nendobj\n' % (pk, body))
+
+    def stream(self, pk, data, **entries):
+        data = zlib.compress(data)
+        head = dictionary(
+            {'Length': len(data), 'Filter': '/FlateDecode', **entries}
+        )
+        return self.object(
+            pk, head + b'\nstream\n' + data + b'\nendstream'
+        )
+
+    def text(self, x, y, size, text):
+        """Операторы одной строки текста."""
+        if not self.dynamic:
+            chunks = [(0, text.encode(STANDARD_ENCODING, 'replace'))]
+        else:
+            chunks = self.font.splitString(text, self)
+        shows = ' '.join(
+            f'/F{subset} {pdf_number(size)} Tf <{chunk.hex()}> Tj'
+            for subset, chunk in chunks
+        )
+        return 'BT {} {} Td {} ET'.format(
+            pdf_number(x), pdf_number(y), shows
+        ).encode()
+
+    def start(self):
+        return self.write(HEADER)
+
+    def page(self, lines):
+        """Страница из строк (x, y, размер шрифта, текст)."""
+        contents = self.reserve()
+        page = self.reserve()
+        self.pages.append(page)
+        return self.stream(
+            contents, b'\n'.join(self.text(*line) for line in lines)
+        ) + self.object(page, dictionary({
+            'Type': '/Page',
+            'Parent': ref(PAGES),
+            'MediaBox': '[0 0 {} {}]'.format(
+                pdf_number(self.width), pdf_number(self.height)
+            ),
+            'Resources': f'<< /Font {ref(FONTS)} >>',
+            'Contents': ref(contents),
+        }))
+
+    def standard_fonts(self):
+        font = self.reserve()
+        yield self.object(font, dictionary({
+            'Type': '/Font',
+            'Subtype': '/Type1',
+            'BaseFont': f'/{self.font.face.name}',
+            'Encoding': '/WinAnsiEncoding',
+        }))
+        yield self.object(FONTS, dictionary({'F0': ref(font)}))
+
+    def truetype_fonts(self):
+        """Подмножества шрифта, которые понадобились страницам."""
+        state = self.font.state.pop(self, None)
+        face = self.font.face
+        fonts = {}
+        for index, subset in enumerate(state.subsets if state else ()):
+            name = b''.join(
+                (SUBSETN(index), b'+', face.name, face.subfontNameX)
+            ).decode('latin-1')
+            font_file, descriptor, cmap, font = (
+                self.reserve() for _ in range(4)
+            )
+            data = face.makeSubset(subset)
+            yield self.stream(font_file, data, Length1=len(data))
+            yield self.object(descriptor, dictionary({
+                'Type': '/FontDescriptor',
+                'FontName': f'/{name}',
+                'Flags': face.flags & ~FF_NONSYMBOLIC | FF_SYMBOLIC,
+                'FontBBox': '[{}]'.format(
+                    ' '.join(map(pdf_number, face.bbox))
+                ),
+                'ItalicAngle': pdf_number(face.italicAngle),
+                'Ascent': face.ascent,
+                'Descent': face.descent,
+                'CapHeight': face.capHeight,
+                'StemV': face.stemV,
+                'MissingWidth': face.defaultWidth,
+                'FontFile2': ref(font_file),
+            }))
+            yield self.stream(
+                cmap, makeToUnicodeCMap(name, subset).encode()
+            )
+            yield self.object(font, dictionary({
+                'Type': '/Font',
+                'Subtype': '/TrueType',
+                'BaseFont': f'/{name}',
+                'FirstChar': 0,
+                'LastChar': len(subset) - 1,
+                'Widths': '[{}]'.format(' '.join(
+                    pdf_number(face.getCharWidth(code)) for code in subset
+                )),
+                'FontDescriptor': ref(descriptor),
+                'ToUnicode': ref(cmap),
+            }))
+            fonts[f'F{index}'] = ref(font)
+        yield self.object(FONTS, dictionary(fonts))
+
+    def finish(self):
+        """Шрифты, дерево страниц, каталог и таблица смещений."""
+        fonts = self.truetype_fonts() if self.dynamic else (
+            self.standard_fonts()
+        )
+        data = b''.join(fonts)
+        data += self.object(PAGES, dictionary({
+            'Type': '/Pages',
+            'Kids': '[{}]'.format(' '.join(map(ref, self.pages))),
+            'Count': len(self.pages),
+        }))
+        data += self.object(CATALOG, dictionary({
+            'Type': '/Catalog', 'Pages': ref(PAGES)
+        }))
+        xref = self.offset
+        data += self.write(
+            b'xref\n0 %d\n0000000000 65535 f \n' % (self.count + 1)
+            + b''.join(
+                b'%010d 00000 n \n' % self.offsets[pk]
+                for pk in range(1, self.count + 1)
+            )
+            + b'trailer\n' + dictionary({
+                'Size': self.count + 1, 'Root': ref(CATALOG)
+            })
+            + b'\nstartxref\n%d\n%%%%EOF\n' % xref
+        )
+        return data
@@ -1,19 +1,31 @@
 import re
 import base64
+from collections import OrderedDict
+from collections.abc import Mapping
 
 import webcolors
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Manager, Prefetch, prefetch_related_objects
 from djoser.serializers import UserCreateSerializer
 from rest_framework import serializers
 from rest_framework.fields import CurrentUserDefault
-from rest_framework.relations import SlugRelatedField
+from rest_framework.relations import MANY_RELATION_KWARGS, SlugRelatedField
 
+from jobs.models import DONE, Job
+from jobs.queue import enqueue
+from recipes.composition import set_ingredients
+from recipes.images import variant_paths
 from recipes.models import (Favorite,
                             Follow,
+                            ImageUpload,
                             Ingredient,
                             IngredientRecipe,
                             Recipe,
+                            ShoppingCartItem,
                             ShoppingList,
                             Tag,
                             )
@@ -21,6 +33,8 @@ from users.models import (User,
                           FIELD_EMAIL_MAX_LENGTH,
                           FIELDS_USER_MAX_LENGTH,
                           )
+from api.cache import get_recipe_fragments
+from api.exports import EXPORTS
 from api.pagination import NUMBER
 
 FIELD_RECIPE_NAME_MAX_LENGTH: int = 400
@@ -35,6 +49,27 @@ class Base64ImageField(serializers.ImageField):
         return super().to_internal_value(data)
 
 
+def image_variant_urls(recipe, request=None):
+    """Ссылки на уменьшенные копии картинки рецепта
+    {имя: {формат: ссылка}} или None, пока копии не построены."""
+    paths = variant_paths(recipe)
+    if paths is None:
+        return None
+    return {
+        name: {
+            extension: absolute_url(request, default_storage.url(path))
+            for extension, path in formats.items()
+        }
+        for name, formats in paths.items()
+    }
+
+
+def absolute_url(request, url):
+    if request is None:
+        return url
+    return request.build_absolute_uri(url)
+
+
 class Hex2NameColor(serializers.Field):
     def to_representation(self, value):
         return value
@@ -44,6 +79,122 @@ class Hex2NameColor(serializers.Field):
         return data
 
 
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField, который в списке (many=True или поле
+    вложенного сериализатора с BulkListSerializer) находит все объекты
+    одним запросом IN и сообщает обо всех отсутствующих id сразу."""
+    default_error_messages = {
+        'does_not_exist_many': 'Объекты с id {pk_values} не найдены.',
+    }
+
+    def __init__(self, **kwargs):
+        self.resolved = None
+        super().__init__(**kwargs)
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_pk(self, value):
+        if self.pk_field is not None:
+            value = self.pk_field.to_internal_value(value)
+        try:
+            return self.get_queryset().model._meta.pk.to_python(value)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(value).__name__)
+
+    def resolve(self, data):
+        """{pk: объект} для всех значений data одним запросом."""
+        pks = [self.to_pk(value) for value in data]
+        objects = self.get_queryset().in_bulk(pks) if pks else {}
+        missing = [str(pk) for pk in dict.fromkeys(pks) if pk not in objects]
+        if missing:
+            self.fail('does_not_exist_many', pk_values=', '.join(missing))
+        return objects
+
+    def to_internal_value(self, data):
+        if self.resolved is None:
+            return super().to_internal_value(data)
+        return self.resolved[self.to_pk(data)]
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+
+    def to_internal_value(self, data):
+        if isinstance(data, (list, tuple)):
+            self.child_relation.resolved = self.child_relation.resolve(data)
+        try:
+            return super().to_internal_value(data)
+        finally:
+            self.child_relation.resolved = None
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """Список вложенных объектов, в котором поля
+    BulkPrimaryKeyRelatedField всех элементов разрешаются заранее,
+    по одному запросу на поле."""
+
+    def to_internal_value(self, data):
+        fields = [
+            field for field in self.child.fields.values()
+            if isinstance(field, BulkPrimaryKeyRelatedField)
+            and not field.read_only
+        ]
+        if isinstance(data, list):
+            for field in fields:
+                field.resolved = field.resolve(
+                    item[field.field_name] for item in data
+                    if isinstance(item, Mapping) and field.field_name in item
+                )
+        try:
+            return super().to_internal_value(data)
+        finally:
+            for field in fields:
+                field.resolved = None
+
+
+class ImageUploadSerializer(serializers.ModelSerializer):
+    """Сериализатор загруженной картинки рецепта."""
+
+    class Meta:
+        model = ImageUpload
+        fields = ('token', 'image',)
+
+
+class ShoppingListExportSerializer(serializers.ModelSerializer):
+    """Сериализатор фоновой выгрузки списка покупок. Ссылка на файл
+    появляется, когда задача выполнена."""
+    format = serializers.ChoiceField(
+        choices=tuple(EXPORTS),
+        default='pdf',
+        source='payload.export_format',
+    )
+    url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = ('id', 'status', 'format', 'url', 'created', 'finished',)
+        read_only_fields = ('status', 'created', 'finished',)
+
+    def get_url(self, obj):
+        if obj.status != DONE or not obj.result:
+            return None
+        return absolute_url(
+            self.context.get('request'),
+            default_storage.url(obj.result['path']),
+        )
+
+    def create(self, validated_data):
+        return enqueue('api.shopping_list_export', {
+            'user_id': self.context['request'].user.pk,
+            'export_format': validated_data['payload']['export_format'],
+        })
+
+
 class IngredientSerializer(serializers.ModelSerializer):
     """Сериализатор для страницы списка Ингредиентов."""
 
@@ -52,6 +203,19 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit',)
 
 
+class ShoppingCartItemSerializer(serializers.ModelSerializer):
+    """Сериализатор суммы ингредиента в Списке покупок."""
+    id = serializers.IntegerField(source='ingredient_id')
+    name = serializers.CharField(source='ingredient.name')
+    measurement_unit = serializers.CharField(
+        source='ingredient.measurement_unit'
+    )
+
+    class Meta:
+        model = ShoppingCartItem
+        fields = ('id', 'name', 'measurement_unit', 'amount',)
+
+
 class IngredientForRecipeReadOnlySerializer(serializers.ModelSerializer):
     """Сериализатор Ингредиентов из модели Ингредиент/Рецепт для сериализатора
     RecipeReadOnlySerializer. Только на чтение."""
@@ -80,9 +244,7 @@ class IngredientForRecipeReadOnlySerializer(serializers.ModelSerializer):
 class IngredientForRecipeCreateSerializer(serializers.ModelSerializer):
     """Сериализатор Ингредиента из модели Ингредиент/Рецепт для создания
     Рецепта."""
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all()
-    )
+    id = BulkPrimaryKeyRelatedField(queryset=Ingredient.objects.all())
     amount = serializers.IntegerField(
         write_only=True, max_value=settings.MAX_VALUE,
         min_value=settings.MIN_VALUE
@@ -90,6 +252,7 @@ class IngredientForRecipeCreateSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = IngredientRecipe
+        list_serializer_class = BulkListSerializer
         fields = (
             'id',
             'amount'
@@ -102,7 +265,7 @@ class TagSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Tag
-        fields = ('__all__')
+        fields = ('id', 'name', 'color', 'slug',)
 
 
 class UserAfterRegistSerializer(serializers.ModelSerializer):
@@ -132,10 +295,12 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context['request'].user
-        if user.follower.filter(author=obj).exists():
-            return True
-        return False
+        if user.is_anonymous:
+            return False
+        return user.follower.filter(author=obj).exists()
 
 
 class UserSignupSerializer(UserCreateSerializer):
@@ -206,17 +371,87 @@ class UserSignupSerializer(UserCreateSerializer):
         return UserAfterRegistSerializer(instance, context=context).data
 
 
+class AuthorFragmentSerializer(serializers.ModelSerializer):
+    """Данные автора без поля is_subscribed для RecipeFragmentSerializer."""
+
+    class Meta:
+        model = User
+        fields = ('email', 'id', 'username', 'first_name', 'last_name',)
+
+
+class RecipeFragmentSerializer(serializers.ModelSerializer):
+    """Не зависящая от пользователя часть RecipeReadOnlySerializer.
+
+    Результат кешируется для каждого рецепта, поэтому сериализатор
+    работает без request: ссылка на картинку остаётся относительной."""
+    tags = TagSerializer(many=True)
+    author = AuthorFragmentSerializer()
+    ingredients = serializers.SerializerMethodField()
+    image = Base64ImageField()
+    images = serializers.SerializerMethodField()
+
+    prefetch = (
+        'author',
+        'tags',
+        Prefetch(
+            'ingredient',
+            queryset=IngredientRecipe.objects.select_related('ingredient'),
+        ),
+    )
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'id',
+            'tags',
+            'author',
+            'ingredients',
+            'name',
+            'image',
+            'images',
+            'text',
+            'cooking_time',
+        )
+
+    def get_ingredients(self, obj):
+        return IngredientForRecipeReadOnlySerializer(
+            obj.ingredient.all(), many=True
+        ).data
+
+    def get_images(self, obj):
+        return image_variant_urls(obj)
+
+    @classmethod
+    def render(cls, recipes):
+        prefetch_related_objects(recipes, *cls.prefetch)
+        return cls(recipes, many=True).data
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Сериализует страницу рецептов одним обращением к кешу фрагментов."""
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, Manager) else data
+        return self.child.to_representations(list(iterable))
+
+
 class RecipeReadOnlySerializer(serializers.ModelSerializer):
-    """Сериализатор Рецепта. Только на чтение."""
+    """Сериализатор Рецепта. Только на чтение.
+
+    Общая для всех пользователей часть берётся из кеша фрагментов
+    (RecipeFragmentSerializer), поля is_favorited, is_in_shopping_cart
+    и author.is_subscribed добавляются для текущего пользователя."""
     tags = TagSerializer(many=True)
     author = UserSerializer(read_only=True)
     ingredients = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField(read_only=False)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=False)
     image = Base64ImageField()
+    images = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
+        list_serializer_class = RecipeListSerializer
         fields = (
             'id',
             'tags',
@@ -226,42 +461,100 @@ class RecipeReadOnlySerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'images',
             'text',
             'cooking_time',
         )
 
+    def to_representation(self, instance):
+        return self.to_representations([instance])[0]
+
+    def to_representations(self, recipes):
+        fragments = get_recipe_fragments(
+            recipes, RecipeFragmentSerializer.render
+        )
+        return [
+            self.add_user_fields(fragments[recipe.pk], recipe)
+            for recipe in recipes
+        ]
+
+    def add_user_fields(self, fragment, recipe):
+        request = self.context.get('request')
+        data = OrderedDict()
+        for field in self.Meta.fields:
+            if field == 'is_favorited':
+                data[field] = self.get_is_favorited(recipe)
+            elif field == 'is_in_shopping_cart':
+                data[field] = self.get_is_in_shopping_cart(recipe)
+            else:
+                data[field] = fragment[field]
+        data['author'] = OrderedDict(
+            fragment['author'],
+            is_subscribed=self.get_author_is_subscribed(recipe),
+        )
+        if data['image'] and request is not None:
+            data['image'] = request.build_absolute_uri(data['image'])
+        if data['images'] and request is not None:
+            data['images'] = {
+                name: {
+                    extension: request.build_absolute_uri(url)
+                    for extension, url in urls.items()
+                }
+                for name, urls in data['images'].items()
+            }
+        return data
+
+    def get_images(self, obj):
+        return image_variant_urls(obj, self.context.get('request'))
+
     def get_ingredients(self, obj):
         return IngredientForRecipeReadOnlySerializer(
             obj.ingredient.all(), many=True
         ).data
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context['request'].user
-        if user.favorites.filter(recipe=obj).exists():
-            return True
-        return False
+        if user.is_anonymous:
+            return False
+        return user.favorites.filter(recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+        user = self.context['request'].user
+        if user.is_anonymous:
+            return False
+        return user.shoppings.filter(recipe=obj).exists()
+
+    def get_author_is_subscribed(self, obj):
+        if hasattr(obj, 'author_is_subscribed'):
+            return obj.author_is_subscribed
         user = self.context['request'].user
-        if user.shoppings.filter(recipe=obj).exists():
-            return True
-        return False
+        if user.is_anonymous:
+            return False
+        return user.follower.filter(author_id=obj.author_id).exists()
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """Сериализатор создания Рецепта."""
     author = UserSerializer(read_only=True)
     ingredients = IngredientForRecipeCreateSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all(),
     )
-    image = Base64ImageField()
+    image = Base64ImageField(required=False)
+    image_token = serializers.UUIDField(write_only=True, required=False)
     name = serializers.CharField(max_length=FIELD_RECIPE_NAME_MAX_LENGTH)
     cooking_time = serializers.IntegerField(
         max_value=settings.MAX_VALUE, min_value=settings.MIN_VALUE
     )
 
+    # Поля рецепта, которые записывает update().
+    EDITABLE_FIELDS = ['image', 'name', 'text', 'cooking_time']
+
     class Meta:
         model = Recipe
         fields = (
@@ -269,6 +562,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             'ingredients',
             'tags',
             'image',
+            'image_token',
             'name',
             'text',
             'cooking_time',
@@ -299,44 +593,88 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             )
         return value
 
-    def create_ingredients(self, ingredients, recipe):
-        for ingredient in ingredients:
-            create_ingredient = ingredient.get('id')
-            create_amount = ingredient.get('amount')
-            IngredientRecipe.objects.bulk_create(
-                ingredient=create_ingredient,
-                amount=create_amount,
-                recipe=recipe
+    def validate_image_token(self, value):
+        upload = ImageUpload.objects.filter(
+            token=value, user=self.context['request'].user
+        ).first()
+        if upload is None:
+            raise serializers.ValidationError('Загрузка не найдена')
+        return upload
+
+    def validate(self, attrs):
+        """Картинка передаётся либо строкой base64 в image, либо
+        токеном картинки, загруженной через /api/recipes/images/."""
+        upload = attrs.pop('image_token', None)
+        if upload is not None:
+            if 'image' in attrs:
+                raise serializers.ValidationError(
+                    'Укажите либо image, либо image_token'
+                )
+            attrs['image'] = upload.image.name
+            attrs['image_upload'] = upload
+        elif self.instance is None and 'image' not in attrs:
+            raise serializers.ValidationError(
+                {'image': 'Обязательное поле.'}
+            )
+        return attrs
+
+    @staticmethod
+    def use_upload(upload):
+        """Удаляет загрузку, чтобы токен нельзя было использовать
+        повторно; файл остаётся за рецептом."""
+        if upload is None:
+            return
+        if not ImageUpload.objects.filter(pk=upload.pk).delete()[0]:
+            raise serializers.ValidationError(
+                {'image_token': 'Загрузка уже использована'}
             )
 
+    @staticmethod
+    def ingredient_amounts(ingredients):
+        return {
+            ingredient['id'].pk: ingredient['amount']
+            for ingredient in ingredients
+        }
+
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context['request'].user
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
+        upload = validated_data.pop('image_upload', None)
         recipe = Recipe.objects.create(author=author, **validated_data)
+        self.use_upload(upload)
         recipe.tags.set(tags)
-        self.create_ingredients(ingredients, recipe)
+        set_ingredients(
+            recipe, self.ingredient_amounts(ingredients), created=True
+        )
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.image = validated_data.get('image', instance.image)
-        instance.name = validated_data.get('name', instance.name)
-        instance.text = validated_data.get('text', instance.text)
-        instance.cooking_time = validated_data.get(
-            'cooking_time', instance.cooking_time
+        """Сохраняются только поля из EDITABLE_FIELDS: маску тегов,
+        счётчики и копии картинки обновляют запросы в обработчиках,
+        и полное сохранение затёрло бы их значениями из памяти.
+        Теги и ингредиенты меняются после сохранения по разнице
+        со старым составом: tags.set() сам удаляет и добавляет только
+        отличающиеся связи."""
+        for field in self.EDITABLE_FIELDS:
+            if field in validated_data:
+                setattr(instance, field, validated_data[field])
+        instance.save(update_fields=self.EDITABLE_FIELDS)
+        instance.tags.set(validated_data['tags'])
+        set_ingredients(
+            instance, self.ingredient_amounts(validated_data['ingredients'])
         )
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        instance.ingredients.clear()
-        instance.tags.clear()
-        instance.tags.set(tags)
-        self.create_ingredients(ingredients, instance)
-        instance.save()
+        self.use_upload(validated_data.get('image_upload'))
         return instance
 
     def to_representation(self, instance):
         request = self.context.get('request')
         context = {'request': request}
+        # Копии картинки строятся после фиксации транзакции и могли
+        # быть сохранены уже после того, как рецепт был прочитан.
+        instance.refresh_from_db(fields=['image_variants'])
         return RecipeReadOnlySerializer(instance, context=context).data
 
 
@@ -344,9 +682,14 @@ class RecipeInFavoriteShopListSubsc(serializers.ModelSerializer):
     """Сериализатор вывода информации о Рецепте после
     добавления в Избранное и Список покупок и на странице Подписок.
     Только на чтение."""
+    images = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time',)
+        fields = ('id', 'name', 'image', 'images', 'cooking_time',)
+
+    def get_images(self, obj):
+        return image_variant_urls(obj, self.context.get('request'))
 
 
 class UsersInSubscriptionSerializer(UserSerializer):
@@ -370,26 +713,22 @@ class UsersInSubscriptionSerializer(UserSerializer):
             'recipes_count'
         )
 
-    def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        if user.follower.filter(author=obj).exists():
-            return True
-        return False
-
     def get_recipes(self, obj):
         request = self.context.get('request')
         context = {'request': request}
-        recipes_limit = request.GET.get('recipes_limit', NUMBER)
-        recipes_by_authors = obj.recipe.all()
-        if recipes_limit:
-            recipes_by_authors = recipes_by_authors[:(int(recipes_limit))]
+        recipes_by_author = self.context.get('recipes_by_author')
+        if recipes_by_author is not None:
+            recipes_by_authors = recipes_by_author.get(obj.pk, [])
+        else:
+            recipes_by_authors = obj.recipe.all()[
+                :self.context.get('recipes_limit', NUMBER)
+            ]
         return RecipeInFavoriteShopListSubsc(
             recipes_by_authors, many=True, context=context
         ).data
 
     def get_recipes_count(self, obj):
-        count_recipes = obj.recipe.all()
-        return count_recipes.count()
+        return obj.recipes_count
 
 
 class FollowSerializer(serializers.ModelSerializer):
@@ -421,9 +760,9 @@ class FollowSerializer(serializers.ModelSerializer):
         return value
 
     def to_representation(self, instance):
-        request = self.context.get('request')
-        context = {'request': request}
-        return UsersInSubscriptionSerializer(instance, context=context).data
+        return UsersInSubscriptionSerializer(
+            instance, context=self.context
+        ).data
 
 
 class ShoppingListSerializer(serializers.ModelSerializer):
@@ -488,3 +827,15 @@ class ChangePasswordSerializer(serializers.ModelSerializer):
             'current_password',
             'new_password'
         )
+
+
+class BatchSerializer(serializers.Serializer):
+    """Список id для пакетных операций. Повторы отбрасываются."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BATCH_MAX_SIZE,
+    )
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))
@@ -0,0 +1,101 @@
+from django.db import transaction
+from django.db.models.signals import (m2m_changed,
+                                      post_delete,
+                                      post_save,
+                                      pre_delete,
+                                      )
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import TRACKED_FIELDS, invalidate_tokens
+from api.autocomplete import invalidate_ingredients
+from api.cache import invalidate_recipes
+from api.snapshots import build_snapshot
+from recipes.models import (Ingredient,
+                            IngredientRecipe,
+                            Recipe,
+                            Tag,
+                            TagRecipe,
+                            )
+from users.models import User
+
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+def invalidate_on_commit(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    transaction.on_commit(lambda: invalidate_recipes(recipe_ids))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    invalidate_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+@receiver(post_save, sender=TagRecipe)
+@receiver(post_delete, sender=TagRecipe)
+def recipe_relation_changed(sender, instance, **kwargs):
+    invalidate_on_commit([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_on_commit([instance.pk])
+    elif pk_set:
+        invalidate_on_commit(pk_set)
+    else:
+        invalidate_on_commit(instance.recipe.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: build_snapshot('tags'))
+    invalidate_on_commit(
+        Recipe.objects.filter(tags=instance).values_list('pk', flat=True)
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_changed(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_ingredients)
+    transaction.on_commit(lambda: build_snapshot('ingredients'))
+    invalidate_on_commit(
+        Recipe.objects.filter(
+            ingredient__ingredient=instance
+        ).values_list('pk', flat=True)
+    )
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields, **kwargs):
+    if created:
+        return
+    if update_fields is not None and not AUTHOR_FIELDS & set(update_fields):
+        return
+    invalidate_on_commit(instance.recipe.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    key = instance.key
+    transaction.on_commit(lambda: invalidate_tokens([key]))
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields, **kwargs):
+    if created:
+        return
+    if update_fields is not None and not TRACKED_FIELDS & set(update_fields):
+        return
+    keys = list(Token.objects.filter(user=instance).values_list(
+        'key', flat=True
+    ))
+    transaction.on_commit(lambda: invalidate_tokens(keys))
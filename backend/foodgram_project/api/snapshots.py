@@ -0,0 +1,171 @@
+"""Снимки справочников тегов и ингредиентов.
+
+Полный список рендерится в JSON при изменении справочника и сохраняется
+в MEDIA_ROOT/catalog под именем с хешем содержимого вместе со сжатыми
+копиями (.gz и, если установлен brotli, .br). Файлы <name>.json — копии
+текущей версии, их nginx отдаёт на /api/tags/ и /api/ingredients/
+напрямую. Через Django те же байты отдаются со строгим ETag.
+
+Хеш текущей версии записывается в <name>.digest последним. Процессы
+сверяют этот файл при каждом запросе (os.stat) и перечитывают его,
+если файл заменён, поэтому снимок, пересобранный в другом процессе
+(загрузчиком или обработчиком задач), виден сразу."""
+import gzip
+import hashlib
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+from api.serializers import IngredientSerializer, TagSerializer
+from recipes.models import Ingredient, Tag
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CATALOG_DIR = 'catalog'
+DIGEST_LENGTH = 16
+SNAPSHOTS = {
+    'tags': (Tag, TagSerializer),
+    'ingredients': (Ingredient, IngredientSerializer),
+}
+
+# {имя: ((inode, mtime), хеш)} — прочитанные этим процессом хеши.
+_digests = {}
+
+ENCODINGS = [
+    ('gzip', '.gz', lambda content: gzip.compress(content, mtime=0)),
+]
+if brotli is not None:
+    ENCODINGS.insert(0, ('br', '.br', brotli.compress))
+
+
+def get_directory():
+    return os.path.join(settings.MEDIA_ROOT, CATALOG_DIR)
+
+
+def write_file(path, content):
+    """Запись через временный файл, чтобы читатели не видели
+    недописанный снимок."""
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(descriptor, 'wb') as file:
+        file.write(content)
+    os.chmod(temporary, 0o644)
+    os.replace(temporary, path)
+
+
+def remove_stale(directory, name, digest):
+    pattern = re.compile(
+        rf'{name}\.([0-9a-f]{{{DIGEST_LENGTH}}})\.json(\.\w+)?'
+    )
+    for filename in os.listdir(directory):
+        match = pattern.fullmatch(filename)
+        if match and match.group(1) != digest:
+            try:
+                os.remove(os.path.join(directory, filename))
+            except FileNotFoundError:
+                pass
+
+
+def build_snapshot(name):
+    """Рендерит справочник, сохраняет файлы снимка и возвращает хеш."""
+    model, serializer_class = SNAPSHOTS[name]
+    content = JSONRenderer().render(
+        serializer_class(model.objects.all(), many=True).data
+    )
+    digest = hashlib.sha256(content).hexdigest()[:DIGEST_LENGTH]
+    directory = get_directory()
+    os.makedirs(directory, exist_ok=True)
+    variants = [('', content)] + [
+        (suffix, compress(content)) for _, suffix, compress in ENCODINGS
+    ]
+    for suffix, body in variants:
+        path = os.path.join(directory, f'{name}.{digest}.json{suffix}')
+        if not os.path.exists(path):
+            write_file(path, body)
+        write_file(os.path.join(directory, f'{name}.json{suffix}'), body)
+    # Старые файлы удаляются последними: процесс, ещё не увидевший
+    # новый хеш, может открыть файл снимка по старому.
+    write_file(digest_path(name), digest.encode())
+    remove_stale(directory, name, digest)
+    return digest
+
+
+def digest_path(name):
+    return os.path.join(get_directory(), f'{name}.digest')
+
+
+def get_digest(name):
+    """Хеш текущего снимка. Прочитанный хеш хранится в процессе вместе
+    с inode и временем изменения файла и перечитывается при их смене."""
+    path = digest_path(name)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return build_snapshot(name)
+    stamp = (stat.st_ino, stat.st_mtime_ns)
+    cached = _digests.get(name)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    try:
+        with open(path) as file:
+            digest = file.read().strip()
+    except FileNotFoundError:
+        return build_snapshot(name)
+    _digests[name] = (stamp, digest)
+    return digest
+
+
+def accepted_encodings(request):
+    accepted = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = params.strip().partition('q=')[2]
+        try:
+            if quality and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def snapshot_response(request, name):
+    """Ответ со снимком справочника: 304, если ETag клиента совпадает
+    с текущей версией, иначе самый компактный принимаемый вариант."""
+    accepted = accepted_encodings(request)
+    encoding, suffix = next(
+        (
+            (encoding, suffix) for encoding, suffix, _ in ENCODINGS
+            if encoding in accepted
+        ),
+        (None, ''),
+    )
+    digest = get_digest(name)
+    etags = {f'"{digest}-{coding}"' for coding, _, _ in ENCODINGS}
+    etags.add(f'"{digest}"')
+    etag = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if etags & set(if_none_match) or '*' in if_none_match:
+        response = HttpResponseNotModified()
+    else:
+        path = os.path.join(get_directory(), f'{name}.{digest}.json{suffix}')
+        try:
+            with open(path, 'rb') as file:
+                content = file.read()
+        except FileNotFoundError:
+            build_snapshot(name)
+            return snapshot_response(request, name)
+        response = HttpResponse(content, content_type='application/json')
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
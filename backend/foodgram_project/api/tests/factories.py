@@ -0,0 +1,59 @@
+"""Данные для тестов API."""
+import base64
+import io
+
+from PIL import Image
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+
+def create_user(name):
+    return User.objects.create_user(
+        email=f'{name}@example.com',
+        username=name,
+        first_name=name,
+        last_name=name,
+        password=f'{name}-password',
+    )
+
+
+def create_tag(slug):
+    return Tag.objects.create(name=slug, color='#000000', slug=slug)
+
+
+def create_ingredient(name):
+    return Ingredient.objects.create(name=name, measurement_unit='г')
+
+
+def image_data():
+    buffer = io.BytesIO()
+    Image.new('RGB', (1, 1)).save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+def recipe_data(tags, ingredients, name='Рецепт', text='Описание'):
+    return {
+        'tags': [tag.pk for tag in tags],
+        'ingredients': [
+            {'id': ingredient.pk, 'amount': 10} for ingredient in ingredients
+        ],
+        'image': image_data(),
+        'name': name,
+        'text': text,
+        'cooking_time': 5,
+    }
+
+
+def create_recipe(author, tags=(), name='Рецепт', text='Описание'):
+    recipe = Recipe.objects.create(
+        author=author,
+        name=name,
+        text=text,
+        cooking_time=5,
+        image='recipe/image.png',
+    )
+    recipe.tags.set(tags)
+    return recipe
@@ -0,0 +1,96 @@
+"""Пакетные операции с избранным, списком покупок и подписками."""
+from rest_framework.test import APITestCase
+
+from api.tests.factories import (create_ingredient,
+                                 create_recipe,
+                                 create_user,
+                                 )
+from recipes.models import IngredientRecipe, ShoppingCartItem
+
+MISSING = 10 ** 6
+
+
+def result_statuses(response):
+    return [(item['id'], item['status']) for item in response.data['results']]
+
+
+class BatchTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        cls.author = create_user('author')
+        cls.salt = create_ingredient('Соль')
+        cls.first = create_recipe(cls.author, name='Первый')
+        cls.second = create_recipe(cls.author, name='Второй')
+        for recipe, amount in ((cls.first, 10), (cls.second, 5)):
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=cls.salt, amount=amount
+            )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def post(self, url, ids):
+        return self.client.post(url, {'ids': ids}, format='json')
+
+    def delete(self, url, ids):
+        return self.client.delete(url, {'ids': ids}, format='json')
+
+    def test_favorite_statuses(self):
+        url = '/api/recipes/favorite/batch/'
+        first, second = self.first.pk, self.second.pk
+        response = self.post(url, [first, first, MISSING])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            result_statuses(response),
+            [(first, 'added'), (MISSING, 'not_found')],
+        )
+        response = self.post(url, [first, second])
+        self.assertEqual(
+            result_statuses(response),
+            [(first, 'already_added'), (second, 'added')],
+        )
+        response = self.delete(url, [first, MISSING])
+        self.assertEqual(
+            result_statuses(response),
+            [(first, 'removed'), (MISSING, 'not_added')],
+        )
+
+    def test_shopping_cart_totals(self):
+        url = '/api/recipes/shopping_cart/batch/'
+        self.post(url, [self.first.pk, self.second.pk])
+        item = ShoppingCartItem.objects.get(user=self.user)
+        self.assertEqual(item.amount, 15)
+        self.delete(url, [self.first.pk])
+        item.refresh_from_db()
+        self.assertEqual(item.amount, 5)
+        self.delete(url, [self.second.pk])
+        self.assertFalse(ShoppingCartItem.objects.filter(user=self.user))
+
+    def test_subscribe_statuses(self):
+        url = '/api/users/subscribe/batch/'
+        response = self.post(url, [self.author.pk, self.user.pk, MISSING])
+        self.assertEqual(
+            result_statuses(response),
+            [
+                (self.author.pk, 'added'),
+                (self.user.pk, 'self'),
+                (MISSING, 'not_found'),
+            ],
+        )
+        response = self.delete(url, [self.author.pk, self.author.pk])
+        self.assertEqual(
+            result_statuses(response), [(self.author.pk, 'removed')]
+        )
+
+    def test_invalid_ids(self):
+        url = '/api/recipes/favorite/batch/'
+        for ids in ([], [0], ['x'], 'x'):
+            with self.subTest(ids=ids):
+                self.assertEqual(self.post(url, ids).status_code, 400)
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        response = self.post('/api/recipes/favorite/batch/', [self.first.pk])
+        self.assertEqual(response.status_code, 401)
@@ -0,0 +1,52 @@
+"""Кеш ответов для анонимных пользователей сбрасывается при изменении
+рецепта. Сброс идёт после фиксации транзакции, поэтому тесты работают
+с настоящими транзакциями."""
+from django.core.cache import cache
+from rest_framework.test import APITransactionTestCase
+
+from api.tests.factories import (create_ingredient,
+                                 create_recipe,
+                                 create_tag,
+                                 create_user,
+                                 recipe_data,
+                                 )
+
+
+class RecipeCacheTest(APITransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = create_user('author')
+        self.tag = create_tag('lunch')
+        self.ingredient = create_ingredient('Соль')
+        self.recipe = create_recipe(self.author, [self.tag], name='Суп')
+
+    def rename(self, name):
+        self.client.force_authenticate(self.author)
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.pk}/',
+            recipe_data([self.tag], [self.ingredient], name=name),
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.client.force_authenticate(None)
+
+    def test_detail_invalidated(self):
+        for url in (
+            f'/api/recipes/{self.recipe.pk}/',
+            f'/api/recipes/0{self.recipe.pk}/',
+        ):
+            with self.subTest(url=url):
+                name = f'Суп {url}'
+                self.client.get(url)
+                self.rename(name)
+                self.assertEqual(self.client.get(url).data['name'], name)
+
+    def test_list_invalidated(self):
+        self.client.get('/api/recipes/')
+        self.rename('Борщ')
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(response.data['results'][0]['name'], 'Борщ')
+
+    def test_not_found(self):
+        self.assertEqual(self.client.get('/api/recipes/x/').status_code, 404)
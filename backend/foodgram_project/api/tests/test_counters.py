@@ -0,0 +1,67 @@
+"""Счётчики избранного, списков покупок, рецептов и подписчиков."""
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from rest_framework.test import APITestCase
+
+from api.tests.factories import create_recipe, create_user
+from recipes.counters import COUNTERS, find_mismatches
+from recipes.models import Favorite, Recipe
+from users.models import User
+
+
+class CounterTest(APITestCase):
+
+    def setUp(self):
+        self.author = create_user('author')
+        self.reader = create_user('reader')
+        self.recipe = create_recipe(self.author)
+        self.client.force_authenticate(self.reader)
+
+    def assert_counters_match(self):
+        for counter in COUNTERS:
+            with self.subTest(counter=counter[1]):
+                self.assertFalse(find_mismatches(*counter).exists())
+
+    def counts(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        author = User.objects.get(pk=self.author.pk)
+        return (
+            recipe.favorites_count,
+            recipe.in_cart_count,
+            author.recipes_count,
+            author.followers_count,
+        )
+
+    def test_single_toggles(self):
+        self.client.post(f'/api/recipes/{self.recipe.pk}/favorite/')
+        self.client.post(f'/api/recipes/{self.recipe.pk}/shopping_cart/')
+        self.client.post(f'/api/users/{self.author.pk}/subscribe/')
+        self.assertEqual(self.counts(), (1, 1, 1, 1))
+        self.assert_counters_match()
+        self.client.delete(f'/api/recipes/{self.recipe.pk}/favorite/')
+        self.client.delete(f'/api/recipes/{self.recipe.pk}/shopping_cart/')
+        self.client.delete(f'/api/users/{self.author.pk}/subscribe/')
+        self.assertEqual(self.counts(), (0, 0, 1, 0))
+        self.assert_counters_match()
+
+    def test_cascade_delete(self):
+        """Удаление рецепта и читателя уменьшает счётчики связанных
+        строк, хотя строки удаляются каскадом."""
+        Favorite.objects.create(user=self.reader, recipe=self.recipe)
+        self.client.post(f'/api/users/{self.author.pk}/subscribe/')
+        self.reader.delete()
+        self.assertEqual(self.counts(), (0, 0, 1, 0))
+        self.recipe.delete()
+        self.assertEqual(
+            User.objects.get(pk=self.author.pk).recipes_count, 0
+        )
+        self.assert_counters_match()
+
+    def test_rebuild_counters(self):
+        Recipe.objects.filter(pk=self.recipe.pk).update(favorites_count=5)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_counters', '--check', stdout=StringIO())
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assert_counters_match()
+        call_command('rebuild_counters', '--check', stdout=StringIO())
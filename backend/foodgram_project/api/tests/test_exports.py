@@ -0,0 +1,64 @@
+"""Выгрузка списка покупок в PDF."""
+import re
+
+from rest_framework.test import APITestCase
+
+from api.exports import write_pdf
+from api.tests.factories import (create_ingredient,
+                                 create_recipe,
+                                 create_user,
+                                 )
+from recipes.models import IngredientRecipe
+
+OBJECT = re.compile(rb'(\d+) 0 obj\n')
+
+
+class PdfExportTest(APITestCase):
+
+    def assert_valid_pdf(self, data):
+        """Заголовок, конец файла и смещения всех объектов в таблице."""
+        self.assertTrue(data.startswith(b'%PDF-'))
+        self.assertTrue(data.endswith(b'%%EOF\n'))
+        xref = int(data.rsplit(b'startxref\n', 1)[1].split()[0])
+        self.assertTrue(data[xref:].startswith(b'xref\n'))
+        header, *entries = data[xref:].split(b'trailer')[0].splitlines()[1:]
+        first, size = map(int, header.split())
+        self.assertEqual((first, size), (0, len(entries)))
+        for pk, entry in enumerate(entries[1:], 1):
+            offset = int(entry.split()[0])
+            match = OBJECT.match(data, offset)
+            self.assertIsNotNone(match, pk)
+            self.assertEqual(int(match.group(1)), pk)
+        self.assertIn(b'/Count 3', data)
+
+    def test_streamed_by_page(self):
+        """Первая страница уходит раньше, чем прочитаны все строки."""
+        rows = iter([(f'Ингредиент {i}', 'г', i) for i in range(100)])
+        chunks = write_pdf(rows)
+        data = next(chunks) + next(chunks)
+        self.assertIn(b'/Type /Page ', data)
+        self.assertIsNotNone(next(rows, None))
+        rest = list(chunks)
+        self.assertGreater(len(rest), 2)
+        self.assert_valid_pdf(data + b''.join(rest))
+
+    def test_download(self):
+        user = create_user('reader')
+        recipe = create_recipe(create_user('author'))
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
+                recipe=recipe,
+                ingredient=create_ingredient(f'Ингредиент {i}'),
+                amount=i + 1,
+            )
+            for i in range(100)
+        )
+        self.client.force_authenticate(user)
+        self.client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=pdf'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(response.streaming)
+        self.assert_valid_pdf(b''.join(response.streaming_content))
@@ -0,0 +1,64 @@
+"""Лента подписок: раскладка при публикации и забор при чтении."""
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from api.tests.factories import create_recipe, create_user
+from recipes.feed import fan_out
+from recipes.models import Follow
+
+FEED = '/api/recipes/feed/'
+
+
+def result_ids(response):
+    return [recipe['id'] for recipe in response.data['results']]
+
+
+class FeedTest(APITestCase):
+
+    def setUp(self):
+        self.author = create_user('author')
+        self.reader = create_user('reader')
+        self.follow = Follow.objects.create(
+            user=self.reader, author=self.author
+        )
+        self.client.force_authenticate(self.reader)
+
+    def publish(self):
+        recipe = create_recipe(self.author)
+        fan_out(recipe.pk)
+        return recipe
+
+    def test_fan_out(self):
+        recipe = self.publish()
+        self.assertEqual(result_ids(self.client.get(FEED)), [recipe.pk])
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_pull(self):
+        first = self.publish()
+        self.assertEqual(result_ids(self.client.get(FEED)), [first.pk])
+        second = self.publish()
+        self.assertEqual(
+            result_ids(self.client.get(FEED)), [second.pk, first.pk]
+        )
+
+    def test_author_below_fanout_limit(self):
+        """Рецепты, опубликованные без раскладки, попадают в ленту и
+        после того, как подписчиков у автора стало меньше предела."""
+        with override_settings(FEED_FANOUT_LIMIT=0):
+            skipped = self.publish()
+        fanned_out = self.publish()
+        self.assertEqual(
+            result_ids(self.client.get(FEED)), [fanned_out.pk, skipped.pk]
+        )
+        self.follow.refresh_from_db()
+        self.assertIsNone(self.follow.feed_synced_at)
+        latest = self.publish()
+        self.assertEqual(
+            result_ids(self.client.get(FEED)),
+            [latest.pk, fanned_out.pk, skipped.pk],
+        )
+
+    def test_unfollow(self):
+        self.publish()
+        self.follow.delete()
+        self.assertEqual(result_ids(self.client.get(FEED)), [])
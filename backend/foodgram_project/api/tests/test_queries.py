@@ -0,0 +1,136 @@
+"""Бюджеты запросов к БД для пакетных операций и списка рецептов.
+
+Число запросов не должно зависеть от числа элементов в пакете или на
+странице: тесты проверяют один и тот же бюджет на разных размерах."""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from rest_framework.test import APITestCase
+
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from users.models import User
+
+# Точка сохранения, INSERT/DELETE ... RETURNING, пересчёт счётчиков,
+# освобождение точки сохранения.
+FAVORITE_BATCH_QUERIES = 4
+# То же и ещё три запроса на суммы ингредиентов списка покупок.
+SHOPPING_CART_BATCH_QUERIES = 7
+# COUNT(*), страница рецептов, авторы, теги и ингредиенты страницы.
+# Когда фрагменты рецептов уже в кеше, остаются COUNT(*) и страница.
+RECIPE_LIST_QUERIES = 5
+RECIPE_LIST_CACHED_QUERIES = 2
+# По ключу: только страница, без COUNT(*).
+RECIPE_LIST_CURSOR_QUERIES = 1
+
+
+def count_queries():
+    """На PostgreSQL перед COUNT(*) читается оценка из pg_class."""
+    return 1 if connection.vendor == 'postgresql' else 0
+
+
+class QueriesTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com',
+            username='author',
+            first_name='Автор',
+            last_name='Рецептов',
+            password='author-password',
+        )
+        cls.user = User.objects.create_user(
+            email='user@example.com',
+            username='user',
+            first_name='Читатель',
+            last_name='Рецептов',
+            password='user-password',
+        )
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {i}', color=f'#00000{i}', slug=f'tag{i}'
+            )
+            for i in range(2)
+        ]
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(3)
+        )
+        ingredients = list(Ingredient.objects.all())
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=cls.author,
+                name=f'Рецепт {i}',
+                text='Описание',
+                cooking_time=5,
+                image='recipe/image.png',
+            )
+            for i in range(settings.BATCH_MAX_SIZE)
+        )
+        cls.recipe_ids = list(
+            Recipe.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe_id=pk, ingredient=ingredient, amount=2)
+            for pk in cls.recipe_ids for ingredient in ingredients
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=pk, tag=tag)
+            for pk in cls.recipe_ids for tag in tags
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+
+class BatchQueriesTest(QueriesTestCase):
+
+    def assert_batch_queries(self, url, queries):
+        for ids in (self.recipe_ids[:1], self.recipe_ids[1:]):
+            with self.assertNumQueries(queries):
+                response = self.client.post(url, {'ids': ids}, format='json')
+            self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(queries):
+            response = self.client.delete(
+                url, {'ids': self.recipe_ids}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {item['status'] for item in response.data['results']},
+            {'removed'},
+        )
+
+    def test_favorite_batch(self):
+        self.assert_batch_queries(
+            '/api/recipes/favorite/batch/', FAVORITE_BATCH_QUERIES
+        )
+
+    def test_shopping_cart_batch(self):
+        self.assert_batch_queries(
+            '/api/recipes/shopping_cart/batch/', SHOPPING_CART_BATCH_QUERIES
+        )
+
+
+class RecipeListQueriesTest(QueriesTestCase):
+
+    def test_page(self):
+        for limit in (6, 30):
+            cache.clear()
+            url = f'/api/recipes/?limit={limit}'
+            with self.assertNumQueries(RECIPE_LIST_QUERIES + count_queries()):
+                response = self.client.get(url)
+            self.assertEqual(len(response.data['results']), limit)
+            with self.assertNumQueries(
+                RECIPE_LIST_CACHED_QUERIES + count_queries()
+            ):
+                self.client.get(url)
+
+    def test_cursor(self):
+        for limit in (6, 30):
+            self.client.get(f'/api/recipes/?limit={limit}&cursor=')
+            with self.assertNumQueries(RECIPE_LIST_CURSOR_QUERIES):
+                response = self.client.get(
+                    f'/api/recipes/?limit={limit}&cursor='
+                )
+            self.assertEqual(len(response.data['results']), limit)
@@ -0,0 +1,38 @@
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from api.serializers import RecipeCreateSerializer
+from api.tests.factories import (create_ingredient,
+                                 create_recipe,
+                                 create_tag,
+                                 create_user,
+                                 recipe_data,
+                                 )
+from recipes.models import Favorite, Recipe, ShoppingList
+
+
+class RecipeUpdateTest(APITestCase):
+
+    def test_update_keeps_concurrent_counters(self):
+        """Изменения счётчиков, зафиксированные между чтением рецепта
+        и его сохранением, не затираются."""
+        author = create_user('author')
+        reader = create_user('reader')
+        tag = create_tag('lunch')
+        ingredient = create_ingredient('Соль')
+        recipe = create_recipe(author, [tag])
+        stale = Recipe.objects.get(pk=recipe.pk)
+        Favorite.objects.create(user=reader, recipe=recipe)
+        ShoppingList.objects.create(user=reader, recipe=recipe)
+        request = APIRequestFactory().patch('/')
+        request.user = author
+        serializer = RecipeCreateSerializer(
+            stale,
+            data=recipe_data([tag], [ingredient], name='Новое название'),
+            context={'request': request},
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.in_cart_count, 1)
@@ -0,0 +1,53 @@
+import base64
+import json
+from urllib.parse import quote
+
+from rest_framework.test import APITestCase
+
+from api.tests.factories import create_recipe, create_user
+from recipes.models import Recipe
+from recipes.search import update_search_index
+
+SEARCH = f'/api/recipes/?search={quote("суп")}'
+
+
+class SearchPaginationTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('author')
+        cls.soups = [
+            create_recipe(author, name=f'Суп {i}', text='суп ' * (i + 1))
+            for i in range(5)
+        ]
+        create_recipe(author, name='Каша', text='Овсяная каша')
+        # Индекс обновляется после фиксации транзакции, которой в
+        # TestCase нет.
+        update_search_index(Recipe.objects.values_list('pk', flat=True))
+
+    def test_follow_next_links(self):
+        url = f'{SEARCH}&limit=2&cursor='
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(
+            sorted(seen), sorted(recipe.pk for recipe in self.soups)
+        )
+
+    def test_order_by_rank(self):
+        response = self.client.get(f'{SEARCH}&cursor=')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [recipe.pk for recipe in reversed(self.soups)],
+        )
+
+    def test_bad_cursor(self):
+        for position in (['x', 1], [1.5, 'x'], [None, 1]):
+            cursor = base64.urlsafe_b64encode(
+                json.dumps(position).encode()
+            ).decode()
+            response = self.client.get(f'{SEARCH}&cursor={cursor}')
+            self.assertEqual(response.status_code, 404)
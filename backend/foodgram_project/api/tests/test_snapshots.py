@@ -0,0 +1,45 @@
+"""Снимки справочников в MEDIA_ROOT/catalog."""
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from api import snapshots
+from api.tests.factories import create_tag
+
+
+class SnapshotTest(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def snapshot_files(self, digest):
+        return {
+            filename for filename in os.listdir(snapshots.get_directory())
+            if filename.startswith(f'tags.{digest}.')
+        }
+
+    def test_stale_files_removed_after_digest(self):
+        """Пока удаляются старые файлы, хеш уже указывает на новые."""
+        old = snapshots.build_snapshot('tags')
+        create_tag('breakfast')
+
+        def remove_stale(directory, name, digest):
+            with open(snapshots.digest_path(name)) as file:
+                self.assertEqual(file.read(), digest)
+            self.assertTrue(self.snapshot_files(old))
+            remove(directory, name, digest)
+
+        remove = snapshots.remove_stale
+        with mock.patch.object(snapshots, 'remove_stale', remove_stale):
+            new = snapshots.build_snapshot('tags')
+        self.assertNotEqual(new, old)
+        self.assertFalse(self.snapshot_files(old))
+        self.assertTrue(self.snapshot_files(new))
+        self.assertEqual(snapshots.get_digest('tags'), new)
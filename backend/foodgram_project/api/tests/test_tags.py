@@ -0,0 +1,100 @@
+from unittest import mock
+
+from django.test import TestCase
+from rest_framework.test import APITestCase
+
+from api.tests.factories import (create_ingredient,
+                                 create_recipe,
+                                 create_tag,
+                                 create_user,
+                                 recipe_data,
+                                 )
+from recipes.models import Recipe
+from recipes.tags import next_free_bit, tags_mask
+
+
+def result_ids(response):
+    return [recipe['id'] for recipe in response.data['results']]
+
+
+class TagFilterTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.breakfast = create_tag('breakfast')
+        cls.dinner = create_tag('dinner')
+        cls.ingredient = create_ingredient('Соль')
+
+    def setUp(self):
+        self.client.force_authenticate(self.author)
+
+    def test_filter_after_tags_edit(self):
+        response = self.client.post(
+            '/api/recipes/',
+            recipe_data([self.breakfast], [self.ingredient]),
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        pk = response.data['id']
+        response = self.client.patch(
+            f'/api/recipes/{pk}/',
+            recipe_data([self.dinner], [self.ingredient]),
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            Recipe.objects.get(pk=pk).tags_mask, tags_mask([self.dinner])
+        )
+        response = self.client.get('/api/recipes/?tags=dinner')
+        self.assertEqual(result_ids(response), [pk])
+        response = self.client.get('/api/recipes/?tags=breakfast')
+        self.assertEqual(result_ids(response), [])
+
+    def test_filter_modes(self):
+        both = create_recipe(self.author, [self.breakfast, self.dinner])
+        dinner = create_recipe(self.author, [self.dinner])
+        response = self.client.get(
+            '/api/recipes/?tags=breakfast&tags=dinner'
+        )
+        self.assertEqual(result_ids(response), [dinner.pk, both.pk])
+        response = self.client.get(
+            '/api/recipes/?tags=breakfast&tags=dinner&tags_mode=all'
+        )
+        self.assertEqual(result_ids(response), [both.pk])
+
+
+class TagBitTest(TestCase):
+
+    def test_bits_are_unique(self):
+        tags = [create_tag(f'tag{i}') for i in range(3)]
+        self.assertEqual(len({tag.bit for tag in tags}), 3)
+
+    def test_taken_bit_retried(self):
+        """Бит, который занял другой тег, пока выбирался свободный,
+        не ломает создание тега."""
+        taken = create_tag('taken')
+        with mock.patch(
+            'recipes.tags.next_free_bit',
+            side_effect=[taken.bit, next_free_bit()],
+        ):
+            tag = create_tag('new')
+        self.assertIsNotNone(tag.bit)
+        self.assertNotEqual(tag.bit, taken.bit)
+
+    @mock.patch('recipes.tags.MAX_TAG_BITS', 2)
+    def test_freed_bit_reused(self):
+        """Бит удалённого тега получает самый старый тег без бита,
+        и маски его рецептов пересчитываются."""
+        first, second, waiting, last = (
+            create_tag(f'tag{i}') for i in range(4)
+        )
+        self.assertEqual((waiting.bit, last.bit), (None, None))
+        recipe = create_recipe(create_user('author'), [second, waiting])
+        first.delete()
+        waiting.refresh_from_db()
+        last.refresh_from_db()
+        self.assertEqual(waiting.bit, first.bit)
+        self.assertIsNone(last.bit)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.tags_mask, tags_mask([second, waiting]))
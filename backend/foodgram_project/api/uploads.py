@@ -0,0 +1,117 @@
+"""Загрузка картинок рецептов файлом, а не строкой base64.
+
+Тело запроса (multipart/form-data с полем image или сама картинка
+с Content-Type: image/*) пишется кусками во временный файл на диске.
+До полного разбора картинки Pillow читает только заголовок: формат
+и размеры проверяются по нему, затем verify() проверяет структуру
+файла без распаковки пикселей."""
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from PIL import Image, UnidentifiedImageError
+from rest_framework import serializers
+from rest_framework.parsers import FileUploadParser
+
+from recipes.models import ImageUpload
+
+DEFAULT_FILENAME = 'upload'
+# Запас на заголовки частей multipart сверх размера самого файла.
+MULTIPART_OVERHEAD = 64 * 1024
+MAX_REQUEST_SIZE = settings.RECIPE_IMAGE_MAX_SIZE + MULTIPART_OVERHEAD
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Пишет файл сразу на диск, минуя память. Данные сверх
+    RECIPE_IMAGE_MAX_SIZE не записываются, а файл отбрасывается."""
+
+    too_large = False
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.too_large = True
+            return None
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if self.too_large:
+            self.file.close()
+            return None
+        return super().file_complete(file_size)
+
+
+class ImageUploadParser(FileUploadParser):
+    """Картинка в теле запроса целиком; имя файла необязательно."""
+    media_type = 'image/*'
+
+    def get_filename(self, stream, media_type, parser_context):
+        return (
+            super().get_filename(stream, media_type, parser_context)
+            or DEFAULT_FILENAME
+        )
+
+
+def check_image(file):
+    """Проверяет формат и размеры по заголовку картинки и возвращает
+    её формат."""
+    try:
+        with Image.open(file) as image:
+            image_format = image.format
+            width, height = image.size
+            if image_format not in settings.RECIPE_IMAGE_FORMATS:
+                raise serializers.ValidationError(
+                    {'image': 'Допустимые форматы: {}.'.format(
+                        ', '.join(settings.RECIPE_IMAGE_FORMATS)
+                    )}
+                )
+            if (
+                max(width, height) > settings.RECIPE_IMAGE_MAX_SIDE
+                or width * height > settings.RECIPE_IMAGE_MAX_PIXELS
+            ):
+                raise serializers.ValidationError(
+                    {'image': 'Картинка больше {0}×{0} пикселей.'.format(
+                        settings.RECIPE_IMAGE_MAX_SIDE
+                    )}
+                )
+            image.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError):
+        raise serializers.ValidationError(
+            {'image': 'Файл не является картинкой или повреждён.'}
+        )
+    file.seek(0)
+    return image_format
+
+
+def save_upload(user, upload):
+    """Проверяет загруженный файл и сохраняет его в хранилище."""
+    image_format = check_image(upload)
+    name = os.path.splitext(os.path.basename(upload.name))[0]
+    image = ImageUpload(user=user)
+    image.image.save(
+        f'{name or DEFAULT_FILENAME}.{image_format.lower()}',
+        File(upload),
+        save=False,
+    )
+    image.save()
+    return image
+
+
+def clear_uploads(before):
+    """Удаляет загрузки, сделанные раньше before и не использованные
+    рецептами, вместе с файлами. Файл удаляется, только если строку
+    удалил именно этот вызов, а не рецепт, забравший загрузку."""
+    removed = 0
+    uploads = ImageUpload.objects.filter(created__lt=before).only(
+        'pk', 'image'
+    )
+    for upload in uploads.iterator():
+        if ImageUpload.objects.filter(pk=upload.pk).delete()[0]:
+            upload.image.delete(save=False)
+            removed += 1
+    return removed
@@ -4,6 +4,7 @@ from rest_framework.routers import DefaultRouter
 from api.views import (CustomUserViewSet,
                        IngredientViewSet,
                        RecipeViewSet,
+                       ShoppingListExportViewSet,
                        TagViewSet,
                        )
 
@@ -11,6 +12,11 @@ router = DefaultRouter()
 
 router.register(r'ingredients', IngredientViewSet, basename='ingredients')
 router.register(r'recipes', RecipeViewSet, basename='recipes')
+router.register(
+    r'shopping_list_exports',
+    ShoppingListExportViewSet,
+    basename='shopping_list_exports',
+)
 router.register(r'tags', TagViewSet, basename='tags')
 router.register(r'users', CustomUserViewSet, basename='users')
 
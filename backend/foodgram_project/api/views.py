@@ -1,35 +1,66 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import BooleanField, Exists, OuterRef, Value
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import (IsAuthenticatedOrReadOnly,
                                         IsAuthenticated
                                         )
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
+from api.autocomplete import ingredient_autocomplete
+from api.cache import cached_response, recipe_detail_key, recipe_list_key
+from api.exports import EXPORTS, shopping_list_response
 from api.filters import IngredientFilter, RecipeFilter
-from api.pagination import CustomPagination
+from api.pagination import NUMBER, CustomPagination
 from api.permissions import AuthorOnly
-from api.serializers import (ChangePasswordSerializer,
+from api.renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
+from api.serializers import (BatchSerializer,
+                             ChangePasswordSerializer,
                              FavoriteSerializer,
                              FollowSerializer,
+                             ImageUploadSerializer,
                              IngredientSerializer,
                              RecipeCreateSerializer,
                              RecipeReadOnlySerializer,
+                             ShoppingCartItemSerializer,
+                             ShoppingListExportSerializer,
                              ShoppingListSerializer,
                              TagSerializer,
                              UsersInSubscriptionSerializer,
                              UserSerializer,
                              UserSignupSerializer,
                              )
+from api.snapshots import snapshot_response
+from api.uploads import (MAX_REQUEST_SIZE,
+                         ImageUploadHandler,
+                         ImageUploadParser,
+                         save_upload,
+                         )
+from recipes.batch import (ADDED,
+                           ALREADY_ADDED,
+                           NOT_ADDED,
+                           REMOVED,
+                           SELF,
+                           add_favorites,
+                           add_to_shopping_list,
+                           follow_authors,
+                           remove_favorites,
+                           remove_from_shopping_list,
+                           unfollow_authors,
+                           )
+from jobs.models import Job
+from recipes.feed import latest_recipes, pull_feed
 from recipes.models import (Favorite,
+                            FeedEntry,
                             Follow,
                             Ingredient,
-                            IngredientRecipe,
                             Recipe,
+                            ShoppingCartItem,
                             ShoppingList,
                             Tag,
                             )
@@ -46,18 +77,48 @@ class ListCreateDestroyViewSet(mixins.CreateModelMixin,
     pagination_class = CustomPagination
 
 
+def batch_response(request, add, remove):
+    """Пакетная операция над списком id: POST добавляет, DELETE удаляет.
+    В ответе статус для каждого id в порядке запроса."""
+    serializer = BatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = serializer.validated_data['ids']
+    operation = add if request.method == 'POST' else remove
+    result = operation(request.user, ids)
+    return Response(
+        {'results': [{'id': pk, 'status': result[pk]} for pk in ids]}
+    )
+
+
 class IngredientViewSet(ReadOnlyModelViewSet):
     """Ингредиенты."""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        """Поиск по name обслуживается индексом в памяти без запроса к БД:
+        сначала совпадения по началу названия, затем по подстроке.
+        Полный список отдаётся из снимка справочника."""
+        name = request.query_params.get('name')
+        if name is not None:
+            return Response(ingredient_autocomplete.search(name))
+        if not request.query_params:
+            return snapshot_response(request, 'ingredients')
+        return super().list(request, *args, **kwargs)
+
 
 class TagViewSet(ReadOnlyModelViewSet):
     """Теги."""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
+    def list(self, request, *args, **kwargs):
+        """Полный список отдаётся из снимка справочника."""
+        if not request.query_params:
+            return snapshot_response(request, 'tags')
+        return super().list(request, *args, **kwargs)
+
 
 class RecipeViewSet(ListCreateDestroyViewSet):
     """Рецепт."""
@@ -65,6 +126,77 @@ class RecipeViewSet(ListCreateDestroyViewSet):
     filterset_class = RecipeFilter
     permission_classes = [IsAuthenticatedOrReadOnly, ]
 
+    @property
+    def cursor_ordering(self):
+        """Ключ пагинации: по релевантности при поиске, иначе по дате."""
+        if self.action == 'feed':
+            return ('-created', '-recipe_id')
+        if self.request.query_params.get('search'):
+            return ('-search_rank', '-id')
+        return ('-created', '-id')
+
+    @property
+    def cursor_only(self):
+        return self.action == 'feed'
+
+    def get_queryset(self):
+        """План загрузки рецептов.
+
+        Страница списка выполняется фиксированным числом запросов
+        независимо от её размера:
+        1. COUNT(*) для пагинации;
+        2. рецепты вместе с флагами is_favorited, is_in_shopping_cart
+           и author.is_subscribed (EXISTS);
+        3. один get_many к кешу за фрагментами и версиями рецептов.
+        Только для рецептов, чьих фрагментов нет в кеше, добавляются
+        ещё три запроса: авторы, теги и ингредиенты вместе с Ingredient
+        (см. RecipeFragmentSerializer.prefetch).
+        Для анонимного пользователя флаги не аннотируются,
+        сериализаторы отдают False без обращения к БД."""
+        queryset = Recipe.objects.all()
+        user = self.request.user
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                is_favorited=Exists(
+                    Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+                ),
+                is_in_shopping_cart=Exists(
+                    ShoppingList.objects.filter(
+                        user=user, recipe=OuterRef('pk')
+                    )
+                ),
+                author_is_subscribed=Exists(
+                    Follow.objects.filter(user=user, author=OuterRef('author'))
+                ),
+            )
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """Анонимные ответы берутся из кеша по нормализованному запросу."""
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        return cached_response(
+            recipe_list_key(request),
+            lambda: super(RecipeViewSet, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        """Ключ строится по числовому id, а не по строке из адреса:
+        /api/recipes/01/ и /api/recipes/1/ — один и тот же рецепт, и сброс
+        версии по id рецепта должен задевать оба."""
+        if request.user.is_authenticated:
+            return super().retrieve(request, *args, **kwargs)
+        try:
+            pk = int(kwargs['pk'])
+        except ValueError:
+            return super().retrieve(request, *args, **kwargs)
+        return cached_response(
+            recipe_detail_key(request, pk),
+            lambda: super(RecipeViewSet, self).retrieve(
+                request, *args, **kwargs
+            ),
+        )
+
     def get_serializer_class(self):
         if self.action in ['create', 'partial_update']:
             return RecipeCreateSerializer
@@ -72,7 +204,11 @@ class RecipeViewSet(ListCreateDestroyViewSet):
             return FavoriteSerializer
         if self.action in ['shopping_cart']:
             return ShoppingListSerializer
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['shopping_cart_summary']:
+            return ShoppingCartItemSerializer
+        if self.action in ['images']:
+            return ImageUploadSerializer
+        if self.action in ['list', 'retrieve', 'feed']:
             return RecipeReadOnlySerializer
 
     def partial_update(self, request, pk=None):
@@ -101,6 +237,33 @@ class RecipeViewSet(ListCreateDestroyViewSet):
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_403_FORBIDDEN)
 
+    def toggle_recipe(self, request, pk, add, remove, errors):
+        """Добавление (POST) и удаление (DELETE) одного рецепта одним
+        INSERT ... ON CONFLICT или DELETE ... RETURNING; код ответа
+        определяется по затронутым строкам."""
+        pk = int(pk) if pk.isdigit() else 0
+        if request.method == 'POST':
+            result = add(request.user, [pk])[pk]
+            if result == ADDED:
+                serializer = self.get_serializer(Recipe.objects.get(pk=pk))
+                return Response(
+                    serializer.data, status=status.HTTP_201_CREATED
+                )
+            if result == ALREADY_ADDED:
+                return Response(
+                    {'error': errors[ALREADY_ADDED]},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        if remove(request.user, [pk])[pk] == REMOVED:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        if not Recipe.objects.filter(pk=pk).exists():
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return Response(
+            {'error': errors[NOT_ADDED]},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -108,37 +271,56 @@ class RecipeViewSet(ListCreateDestroyViewSet):
         url_name='favorite',
     )
     def favorite(self, request, pk=None):
-        user = request.user
-        if request.method == 'POST':
-            try:
-                recipe = Recipe.objects.get(id=pk)
-                recipe_in_fav = user.favorites.filter(recipe=recipe)
-                if recipe_in_fav.exists():
-                    return Response(
-                        {'error': 'Вы уже добавили этот рецепт в избранное'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                Favorite.objects.create(user=user, recipe=recipe)
-                serializer = self.get_serializer(
-                    recipe, context={'request': request}
-                )
-                return Response(
-                    serializer.data, status=status.HTTP_201_CREATED
-                )
-            except Recipe.DoesNotExist:
-                return Response(status=status.HTTP_400_BAD_REQUEST)
+        return self.toggle_recipe(
+            request, pk, add_favorites, remove_favorites, {
+                ALREADY_ADDED: 'Вы уже добавили этот рецепт в избранное',
+                NOT_ADDED: 'Вы не добавляли этот рецепт в избранное',
+            }
+        )
 
-        if request.method == 'DELETE':
-            recipe = get_object_or_404(Recipe, id=pk)
-            recipe_in_fav = user.favorites.filter(recipe=recipe)
-            if recipe_in_fav.exists():
-                recipe_in_fav.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            if not recipe_in_fav.exists():
-                return Response(
-                    {'error': 'Вы не добавляли этот рецепт в избранное'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+    @action(
+        detail=False,
+        methods=['post'],
+        permission_classes=[IsAuthenticated, ],
+        parser_classes=[MultiPartParser, ImageUploadParser],
+        url_name='images',
+    )
+    def images(self, request):
+        """Загрузка картинки рецепта файлом: multipart с полем image
+        или сама картинка в теле запроса. Возвращает токен, который
+        передаётся в image_token при создании и изменении рецепта."""
+        length = request.META.get('CONTENT_LENGTH', '')
+        if length.isdigit() and int(length) > MAX_REQUEST_SIZE:
+            return Response(status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        handler = ImageUploadHandler(request._request)
+        request._request.upload_handlers = [handler]
+        try:
+            upload = request.FILES.get('image') or request.FILES.get('file')
+        except ParseError:
+            upload = None
+        if handler.too_large:
+            return Response(status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        if upload is None:
+            return Response(
+                {'image': 'Файл не передан.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        with upload:
+            image = save_upload(request.user, upload)
+        return Response(
+            self.get_serializer(image).data, status=status.HTTP_201_CREATED
+        )
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated, ],
+        url_path='favorite/batch',
+        url_name='favorite_batch',
+    )
+    def favorite_batch(self, request):
+        """Добавление в избранное и удаление из него списка рецептов."""
+        return batch_response(request, add_favorites, remove_favorites)
 
     @action(
         detail=True,
@@ -147,66 +329,114 @@ class RecipeViewSet(ListCreateDestroyViewSet):
         url_name='shopping_cart',
     )
     def shopping_cart(self, request, pk=None):
-        user = request.user
-        if request.method == 'POST':
-            try:
-                recipe = Recipe.objects.get(id=pk)
-                recipe_in_cart = user.shoppings.filter(recipe=recipe)
-                if recipe_in_cart.exists():
-                    return Response(
-                        {'error':
-                         'Вы уже добавили этот рецепт в список покупок'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                ShoppingList.objects.create(user=user, recipe=recipe)
-                serializer = self.get_serializer(
-                    recipe, context={'request': request}
-                )
-                return Response(
-                    serializer.data, status=status.HTTP_201_CREATED
-                )
-            except Recipe.DoesNotExist:
-                return Response(status=status.HTTP_400_BAD_REQUEST)
+        return self.toggle_recipe(
+            request, pk, add_to_shopping_list, remove_from_shopping_list, {
+                ALREADY_ADDED: 'Вы уже добавили этот рецепт в список покупок',
+                NOT_ADDED: 'Вы не добавляли этот рецепт в список покупок',
+            }
+        )
 
-        if request.method == 'DELETE':
-            recipe = get_object_or_404(Recipe, id=pk)
-            recipe_in_cart = user.shoppings.filter(recipe=recipe)
-            if recipe_in_cart.exists():
-                recipe_in_cart.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            if not recipe_in_cart.exists():
-                return Response(
-                    {'error': 'Вы не добавляли этот рецепт в список покупок'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated, ],
+        url_path='shopping_cart/batch',
+        url_name='shopping_cart_batch',
+    )
+    def shopping_cart_batch(self, request):
+        """Добавление в список покупок и удаление из него списка
+        рецептов."""
+        return batch_response(
+            request, add_to_shopping_list, remove_from_shopping_list
+        )
+
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated, ],
+        methods=['get'],
+        url_name='feed',
+    )
+    def feed(self, request):
+        """Рецепты авторов из подписок, новые выше.
+
+        Лента читается по индексу (user, created) таблицы FeedEntry,
+        пагинация всегда по ключу. Перед чтением в ленту забираются
+        новые рецепты авторов, для которых раскладка не выполняется."""
+        pull_feed(request.user)
+        entries = self.paginate_queryset(
+            FeedEntry.objects.filter(user=request.user)
+        )
+        recipes = self.get_queryset().in_bulk(
+            [entry.recipe_id for entry in entries]
+        )
+        serializer = self.get_serializer(
+            [
+                recipes[entry.recipe_id] for entry in entries
+                if entry.recipe_id in recipes
+            ],
+            many=True,
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated, ],
+        methods=['get'],
+        url_name='shopping_cart_summary',
+    )
+    def shopping_cart_summary(self, request):
+        """Суммы ингредиентов в списке покупок."""
+        items = ShoppingCartItem.objects.filter(
+            user=request.user
+        ).select_related('ingredient').order_by(
+            'ingredient__name', 'ingredient__measurement_unit'
+        )
+        return Response(self.get_serializer(items, many=True).data)
 
     @action(
         detail=False,
         permission_classes=[IsAuthenticated, ],
         methods=['get'],
         url_name='download_shopping_cart',
+        renderer_classes=[PlainTextRenderer,
+                          CSVRenderer,
+                          PDFRenderer,
+                          JSONRenderer,
+                          ],
     )
     def download_shopping_cart(self, request):
+        """Список покупок в формате ?format=txt|csv|pdf (по умолчанию txt)."""
         user = request.user
         if user.is_anonymous:
             return Response(
                 {'detail': 'Вы не авторизаваны'},
                 status=status.HTTP_401_UNAUTHORIZED
             )
-        ingredients_in_shoplist = IngredientRecipe.objects.filter(
-            recipe__shopping__user=user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount')).order_by()
-        shopping_list_str = 'Список покупок:\n'
-        for shopplist in ingredients_in_shoplist:
-            shopping_list_str += (
-                f'- {shopplist["ingredient__name"]} - '
-                f'{shopplist["amount"]} '
-                f'{shopplist["ingredient__measurement_unit"]}\n'
-            )
-        return HttpResponse(shopping_list_str, content_type='text/plain')
+        export_format = request.accepted_renderer.format
+        if export_format not in EXPORTS:
+            export_format = 'txt'
+        return shopping_list_response(user, export_format)
+
+
+class ShoppingListExportViewSet(mixins.CreateModelMixin,
+                                mixins.RetrieveModelMixin,
+                                viewsets.GenericViewSet,
+                                ):
+    """Выгрузка списка покупок фоновой задачей: POST ставит задачу,
+    GET по id показывает её состояние и ссылку на готовый файл."""
+    serializer_class = ShoppingListExportSerializer
+    permission_classes = [IsAuthenticated, ]
+
+    def get_queryset(self):
+        return Job.objects.filter(
+            kind='api.shopping_list_export',
+            payload__user_id=self.request.user.pk,
+        )
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return response
 
 
 class CustomUserViewSet(UserViewSet,
@@ -215,6 +445,7 @@ class CustomUserViewSet(UserViewSet,
     """Пользователи."""
     queryset = User.objects.all()
     permission_classes = [IsAuthenticatedOrReadOnly, ]
+    cursor_ordering = ('-date_joined', '-id')
 
     def get_serializer_class(self):
         if self.action in ['create']:
@@ -262,54 +493,108 @@ class CustomUserViewSet(UserViewSet,
         serializer = self.get_serializer(user)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    def get_subscription_context(self, authors):
+        """Контекст сериализатора подписок: recipes_limit разбирается
+        один раз, последние рецепты всех авторов страницы читаются
+        одним запросом. get_serializer() в этой версии DRF заменяет
+        переданный context, поэтому сериализатор создаётся напрямую."""
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit is None:
+            recipes_limit = NUMBER
+        else:
+            try:
+                recipes_limit = int(recipes_limit)
+                if recipes_limit < 0:
+                    raise ValueError
+            except ValueError:
+                raise ValidationError(
+                    {'recipes_limit': 'Ожидается неотрицательное число.'}
+                )
+        context = self.get_serializer_context()
+        context['recipes_limit'] = recipes_limit
+        context['recipes_by_author'] = latest_recipes(
+            [author.pk for author in authors],
+            recipes_limit,
+            (
+                'id', 'author_id', 'name', 'image', 'image_variants',
+                'cooking_time',
+            ),
+        )
+        return context
+
     @action(
         detail=True,
         methods=['post', 'delete'],
         url_name='subscribe',
     )
     def subscribe(self, request, id=None):
+        """Подписка и отписка одним INSERT ... ON CONFLICT или
+        DELETE ... RETURNING, см. RecipeViewSet.toggle_recipe."""
         user = request.user
-        author = get_object_or_404(User, id=id)
-        author_in_subc = user.follower.filter(author=author)
+        pk = int(id) if id.isdigit() else 0
         if request.method == 'POST':
-            if author_in_subc.exists():
+            result = follow_authors(user, [pk])[pk]
+            if result == ADDED:
+                author = User.objects.get(pk=pk)
+                author.is_subscribed = True
+                serializer = self.get_serializer_class()(
+                    author, context=self.get_subscription_context([author])
+                )
+                return Response(
+                    serializer.data, status=status.HTTP_201_CREATED
+                )
+            if result == ALREADY_ADDED:
                 return Response(
                     {'error': 'Вы уже подписаны на этого пользователя'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            Follow.objects.create(user=user, author=author)
-            serializer = self.get_serializer(
-                author, context={'request': request}
-            )
-            return Response(
-                serializer.data, status=status.HTTP_201_CREATED
-            )
-
-        if request.method == 'DELETE':
-            if author_in_subc.exists():
-                author_in_subc.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            if not author_in_subc.exists():
+            if result == SELF:
                 return Response(
-                    {'error': 'Вы не подписаны на этого пользователя'},
+                    {'error': 'Вы не можете подписаться на себя'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        if unfollow_authors(user, [pk])[pk] == REMOVED:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        if not User.objects.filter(pk=pk).exists():
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return Response(
+            {'error': 'Вы не подписаны на этого пользователя'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated, ],
+        url_path='subscribe/batch',
+        url_name='subscribe_batch',
+    )
+    def subscribe_batch(self, request):
+        """Подписка на список авторов и отписка от них."""
+        return batch_response(request, follow_authors, unfollow_authors)
 
     @action(
         detail=False,
         methods=['get'],
+        permission_classes=[IsAuthenticated, ],
         url_name='subscriptions',
     )
     def subscriptions(self, request):
+        """Авторы, на которых подписан пользователь, с последними
+        рецептами: три запроса на страницу при любом числе авторов."""
         user = request.user
-        queryset = User.objects.filter(following__user=user)
+        queryset = User.objects.filter(following__user=user).annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
+        )
         page = self.paginate_queryset(queryset)
         if page is not None:
-            serializer = self.get_serializer(
-                page, many=True, context={'request': request}
+            serializer = self.get_serializer_class()(
+                page, many=True, context=self.get_subscription_context(page)
             )
             return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(
-            queryset, many=True, context={'request': request}
+        authors = list(queryset)
+        serializer = self.get_serializer_class()(
+            authors, many=True, context=self.get_subscription_context(authors)
         )
         return Response(serializer.data)
@@ -25,8 +25,9 @@ INSTALLED_APPS = [
     'rest_framework.authtoken',
     'djoser',
     'users',
-    'recipes',
-    'api',
+    'recipes.apps.RecipesConfig',
+    'api.apps.ApiConfig',
+    'jobs.apps.JobsConfig',
 ]
 
 MIDDLEWARE = [
@@ -72,6 +73,29 @@ DATABASES = {
 }
 
 
+# Кеш должен быть общим для всех процессов: воркеров gunicorn
+# и обработчиков фоновых задач (run_workers). Сброс кеша в одном
+# процессе не виден в локальном кеше другого, поэтому локальный кеш
+# по умолчанию годится только для разработки в одном процессе без
+# run_workers. В docker-compose используется memcached:
+# CACHE_BACKEND=django.core.cache.backends.memcached.MemcachedCache
+# CACHE_LOCATION=cache:11211
+# Локальному и файловому кешу нужен предел числа записей (по умолчанию
+# у Django 300): в кеше лежит по фрагменту на рецепт.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+if 'memcached' not in CACHES['default']['BACKEND']:
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 20000)),
+    }
+
+
 AUTH_USER_MODEL = "users.User"
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -116,13 +140,20 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'
     ],
 }
 
+# Кеш аутентификации по токену (api.authentication): сколько секунд
+# снимок пользователя живёт в общем кеше и в LRU процесса и сколько
+# снимков хранит LRU.
+AUTH_TOKEN_CACHE_TTL = 300
+AUTH_TOKEN_LOCAL_TTL = 5
+AUTH_TOKEN_LOCAL_SIZE = 1024
+
 DJOSER = {
     'PERMISSIONS': {
         'user': ['rest_framework.permissions.AllowAny'],
@@ -136,3 +167,65 @@ MIN_VALUE: int = 1
 MAX_VALUE: int = 32000
 ZERO = 0
 THOUSAND = 1000
+
+# Начиная с этого количества строк пагинация отдаёт оценку count
+# по статистике PostgreSQL вместо точного COUNT(*).
+PAGINATION_EXACT_COUNT_THRESHOLD: int = int(
+    os.getenv('PAGINATION_EXACT_COUNT_THRESHOLD', 10000)
+)
+
+# TrueType-шрифт с кириллицей для выгрузки списка покупок в PDF.
+SHOPPING_LIST_PDF_FONT: str = os.getenv(
+    'SHOPPING_LIST_PDF_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+# Сколько секунд хранятся закешированные ответы и фрагменты рецептов.
+# Правильность от срока не зависит: устаревают они при смене версии,
+# которую сбрасывают сигналы. Срок только освобождает кеш от записей,
+# которые больше не запрашиваются.
+RECIPE_CACHE_TIMEOUT: int = int(
+    os.getenv('RECIPE_CACHE_TIMEOUT', 24 * 60 * 60)
+)
+
+# Лента подписок: рецепты авторов, у которых подписчиков больше
+# FEED_FANOUT_LIMIT, не раскладываются по лентам при публикации,
+# а забираются в ленту при её чтении.
+FEED_FANOUT_LIMIT: int = int(os.getenv('FEED_FANOUT_LIMIT', 1000))
+FEED_BATCH_SIZE: int = 1000
+FEED_BACKFILL: int = 50
+
+# Наибольшее число id в одном запросе пакетных операций.
+BATCH_MAX_SIZE: int = 500
+
+# Загрузка картинок рецептов (POST /api/recipes/images/): предельный
+# размер файла в байтах, размеры в пикселях, допустимые форматы Pillow
+# и время в часах, после которого неиспользованная загрузка удаляется.
+RECIPE_IMAGE_MAX_SIZE: int = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', 10 * 1024 * 1024)
+)
+RECIPE_IMAGE_MAX_SIDE: int = 8000
+RECIPE_IMAGE_MAX_PIXELS: int = 40_000_000
+RECIPE_IMAGE_FORMATS = ('JPEG', 'PNG', 'WEBP', 'GIF')
+RECIPE_IMAGE_UPLOAD_TTL: int = 24
+
+# Фоновые задачи (приложение jobs, manage.py run_workers): число
+# процессов, пауза между опросами очереди в секундах, попытки и задержка
+# перед повтором (удваивается с каждой попыткой), время, после которого
+# задача без ответа обработчика возвращается в очередь, срок хранения
+# завершённых задач в днях и предельное число одновременно выполняемых
+# задач по типам.
+JOBS_WORKERS: int = int(os.getenv('JOBS_WORKERS', 2))
+JOBS_POLL_INTERVAL: float = 1.0
+JOBS_MAX_ATTEMPTS: int = 5
+JOBS_RETRY_DELAY: int = 10
+JOBS_RETRY_MAX_DELAY: int = 3600
+JOBS_LOCK_TIMEOUT: int = 600
+JOBS_RETENTION: int = 7
+JOBS_CONCURRENCY = {
+    'recipes.image_variants': 2,
+    'recipes.rebuild_counters': 1,
+    'api.shopping_list_export': 2,
+}
+
+# Сколько часов хранится файл списка покупок, выгруженный фоновой задачей.
+SHOPPING_LIST_EXPORT_TTL: int = 24
@@ -0,0 +1,20 @@
+from django.contrib import admin
+
+from jobs.models import Job
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk',
+        'kind',
+        'status',
+        'attempts',
+        'run_at',
+        'finished',
+    )
+    list_filter = ('kind', 'status',)
+    search_fields = ('key',)
+    readonly_fields = ('locked_at', 'locked_by', 'result', 'error',)
+
+
+admin.site.register(Job, JobAdmin)
@@ -0,0 +1,92 @@
+import os
+import signal
+import socket
+import threading
+import time
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from jobs.queue import HANDLERS, work
+
+# Пауза перед перезапуском упавшего процесса, в секундах.
+RESTART_DELAY = 5
+
+
+def run_worker(name, kinds):
+    """Процесс-обработчик: по SIGTERM или SIGINT дорабатывает текущую
+    задачу и завершается."""
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: stop.set())
+    work(name, kinds, stop=stop)
+
+
+class Command(BaseCommand):
+    help = 'Запускает процессы, выполняющие фоновые задачи.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=settings.JOBS_WORKERS,
+            help='Число процессов-обработчиков.',
+        )
+        parser.add_argument(
+            '--kinds',
+            nargs='+',
+            help='Выполнять только задачи этих типов.',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Выполнить готовые задачи в текущем процессе и выйти.',
+        )
+
+    def handle(self, *args, **options):
+        kinds = options['kinds'] or list(HANDLERS)
+        unknown = set(kinds) - set(HANDLERS)
+        if unknown:
+            raise CommandError(
+                'Неизвестные типы задач: ' + ', '.join(sorted(unknown))
+            )
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+        if options['once']:
+            work(prefix, kinds, once=True)
+            return
+        stopping = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *args: stopping.set())
+        # Дочерние процессы не должны унаследовать открытые соединения.
+        connections.close_all()
+        context = get_context('fork')
+        processes = {}
+        self.stdout.write(
+            f'обработчиков: {options["processes"]}, '
+            f'типы задач: {", ".join(sorted(kinds))}'
+        )
+        while not stopping.is_set():
+            for number in range(options['processes']):
+                process = processes.get(number)
+                if process is not None and process.is_alive():
+                    continue
+                if process is not None:
+                    self.stderr.write(
+                        f'обработчик {number} завершился с кодом '
+                        f'{process.exitcode}, перезапуск'
+                    )
+                    time.sleep(RESTART_DELAY)
+                process = context.Process(
+                    target=run_worker,
+                    args=(f'{prefix}/{number}', kinds),
+                    daemon=True,
+                )
+                process.start()
+                processes[number] = process
+            stopping.wait(1)
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
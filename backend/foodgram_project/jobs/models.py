@@ -0,0 +1,77 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Job(models.Model):
+    """Фоновая задача.
+
+    Задачи ставятся в той же транзакции, что и изменение, которое их
+    вызвало, и выполняются процессами manage.py run_workers."""
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Не выполнена'),
+    )
+    kind = models.CharField(max_length=100, verbose_name='Тип')
+    payload = models.JSONField(default=dict, verbose_name='Параметры')
+    key = models.CharField(
+        max_length=200,
+        blank=True,
+        verbose_name='Ключ',
+        help_text='Задачи одного типа с одинаковым ключом '
+                  'не ставятся в очередь дважды',
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUSES,
+        default=QUEUED,
+        verbose_name='Состояние',
+    )
+    run_at = models.DateTimeField(
+        default=timezone.now, verbose_name='Выполнить не раньше'
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0, verbose_name='Попыток'
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        verbose_name='Наибольшее число попыток'
+    )
+    locked_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='Взята в работу'
+    )
+    locked_by = models.CharField(
+        max_length=100, blank=True, verbose_name='Обработчик'
+    )
+    result = models.JSONField(null=True, blank=True, verbose_name='Результат')
+    error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created = models.DateTimeField(auto_now_add=True, verbose_name='Создана')
+    finished = models.DateTimeField(
+        null=True, blank=True, verbose_name='Завершена'
+    )
+
+    class Meta:
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('kind', 'key'),
+                condition=Q(status=QUEUED) & ~Q(key=''),
+                name='unique_queued_job_kind_key',
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('kind', 'status', 'run_at'),
+                name='job_kind_status_run_at_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk} ({self.status})'
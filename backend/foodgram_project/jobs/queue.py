@@ -0,0 +1,228 @@
+"""Очередь фоновых задач в таблице jobs_job.
+
+Задача берётся одной инструкцией UPDATE ... WHERE id = (SELECT ...
+LIMIT 1) RETURNING. На PostgreSQL подзапрос выбирает строку с FOR UPDATE
+SKIP LOCKED: процессы не ждут друг друга и не берут одну задачу дважды.
+На SQLite (тесты) записи в базу и так выполняются по одной.
+
+Для типов из JOBS_CONCURRENCY задача берётся, только если задач этого
+типа выполняется меньше предела; на PostgreSQL взятие задач такого типа
+упорядочено pg_advisory_xact_lock, чтобы два процесса не превысили
+предел одновременно. Упавшая задача возвращается в очередь
+с экспоненциально растущей задержкой, пока не исчерпает попытки."""
+import json
+import logging
+import random
+import time
+import traceback
+import zlib
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection
+from django.db import transaction
+from django.utils import timezone
+
+from jobs.models import DONE, FAILED, QUEUED, RUNNING, Job
+
+logger = logging.getLogger(__name__)
+
+Handler = namedtuple('Handler', 'function max_attempts')
+HANDLERS = {}
+
+# Как часто обработчик возвращает в очередь зависшие задачи
+# и удаляет старые завершённые, в секундах.
+MAINTENANCE_INTERVAL = 60
+
+CLAIM_SQL = (
+    'UPDATE {table} SET status = %s, locked_at = %s, locked_by = %s, '
+    'attempts = attempts + 1 '
+    'WHERE id = ('
+    'SELECT id FROM {table} '
+    'WHERE kind = %s AND status = %s AND run_at <= %s{limit} '
+    'ORDER BY run_at, id LIMIT 1{lock}'
+    ') RETURNING id, payload'
+)
+CONCURRENCY_SQL = (
+    ' AND (SELECT count(*) FROM {table} WHERE kind = %s AND status = %s) < %s'
+)
+
+ClaimedJob = namedtuple('ClaimedJob', 'id kind payload')
+
+
+def register(kind, max_attempts=None):
+    """Регистрирует обработчик задач типа kind. Обработчик получает
+    параметры задачи именованными аргументами; возвращённое значение
+    сохраняется в Job.result."""
+    def decorator(function):
+        HANDLERS[kind] = Handler(
+            function, max_attempts or settings.JOBS_MAX_ATTEMPTS
+        )
+        return function
+    return decorator
+
+
+def enqueue(kind, payload=None, key='', delay=None):
+    """Ставит задачу в очередь в текущей транзакции: если транзакция
+    откатится, задачи не будет. Задача с ключом не добавляется, если
+    такая же ещё ждёт выполнения; тогда возвращается None."""
+    job = Job(
+        kind=kind,
+        payload=payload or {},
+        key=key,
+        max_attempts=HANDLERS[kind].max_attempts,
+        run_at=timezone.now() + (delay or timedelta()),
+    )
+    if not key:
+        job.save()
+        return job
+    Job.objects.bulk_create([job], ignore_conflicts=True)
+    return None
+
+
+def due_kinds(kinds):
+    return list(
+        Job.objects.filter(
+            kind__in=kinds, status=QUEUED, run_at__lte=timezone.now()
+        ).values_list('kind', flat=True).distinct().order_by()
+    )
+
+
+def claim_kind(kind, worker):
+    """Берёт в работу самую раннюю готовую задачу типа kind."""
+    table = connection.ops.quote_name(Job._meta.db_table)
+    now = timezone.now()
+    params = [RUNNING, now, worker, kind, QUEUED, now]
+    limit = ''
+    concurrency = settings.JOBS_CONCURRENCY.get(kind)
+    if concurrency is not None:
+        limit = CONCURRENCY_SQL.format(table=table)
+        params += [kind, RUNNING, concurrency]
+    postgresql = connection.vendor == 'postgresql'
+    lock = ' FOR UPDATE SKIP LOCKED' if postgresql else ''
+    with transaction.atomic(), connection.cursor() as cursor:
+        if concurrency is not None and postgresql:
+            cursor.execute(
+                'SELECT pg_advisory_xact_lock(%s)',
+                [zlib.crc32(kind.encode())],
+            )
+        cursor.execute(
+            CLAIM_SQL.format(table=table, limit=limit, lock=lock), params
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    job_id, payload = row
+    if isinstance(payload, str):
+        payload = json.loads(payload)
+    return ClaimedJob(job_id, kind, payload)
+
+
+def claim(kinds, worker):
+    """Берёт в работу одну задачу одного из типов kinds. Типы
+    перебираются в случайном порядке, чтобы ни один не ждал вечно."""
+    candidates = due_kinds(kinds)
+    random.shuffle(candidates)
+    for kind in candidates:
+        job = claim_kind(kind, worker)
+        if job is not None:
+            return job
+    return None
+
+
+def retry_delay(attempts):
+    """Экспоненциальная задержка со случайной частью, чтобы повторы
+    упавших вместе задач не приходили одновременно."""
+    delay = min(
+        settings.JOBS_RETRY_DELAY * 2 ** max(attempts - 1, 0),
+        settings.JOBS_RETRY_MAX_DELAY,
+    )
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def release(job_id, error):
+    """Возвращает задачу в очередь или отмечает неудачной, если
+    попытки исчерпаны или такая же задача уже стоит в очереди."""
+    job = Job.objects.only('attempts', 'max_attempts').get(pk=job_id)
+    now = timezone.now()
+    if job.attempts < job.max_attempts:
+        try:
+            with transaction.atomic():
+                Job.objects.filter(pk=job_id).update(
+                    status=QUEUED,
+                    run_at=now + retry_delay(job.attempts),
+                    locked_at=None,
+                    locked_by='',
+                    error=error,
+                )
+            return
+        except IntegrityError:
+            error += '\nВ очереди уже есть такая же задача.'
+    Job.objects.filter(pk=job_id).update(
+        status=FAILED, finished=now, error=error
+    )
+
+
+def execute(job):
+    handler = HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise LookupError(f'Нет обработчика задач {job.kind}')
+        result = handler.function(**job.payload)
+    except Exception:
+        logger.exception('Задача %s #%s не выполнена', job.kind, job.id)
+        release(job.id, traceback.format_exc())
+        return False
+    Job.objects.filter(pk=job.id).update(
+        status=DONE, finished=timezone.now(), result=result, error=''
+    )
+    return True
+
+
+def maintain():
+    """Возвращает в очередь задачи, обработчик которых пропал,
+    и удаляет завершённые задачи старше JOBS_RETENTION дней."""
+    now = timezone.now()
+    stale = Job.objects.filter(
+        status=RUNNING,
+        locked_at__lt=now - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT),
+    ).values_list('pk', flat=True)
+    for job_id in stale:
+        release(job_id, 'Обработчик не завершил задачу вовремя.')
+    Job.objects.filter(
+        status__in=(DONE, FAILED),
+        finished__lt=now - timedelta(days=settings.JOBS_RETENTION),
+    ).delete()
+
+
+def work(worker, kinds=None, stop=None, once=False):
+    """Выполняет задачи типов kinds (по умолчанию всех), пока stop
+    (threading.Event) не установлен. once: вернуться, как только
+    готовых задач не останется."""
+    kinds = list(kinds or HANDLERS)
+    maintained = None
+    while stop is None or not stop.is_set():
+        if not once:
+            close_old_connections()
+        if maintained is None or (
+            time.monotonic() - maintained > MAINTENANCE_INTERVAL
+        ):
+            maintain()
+            maintained = time.monotonic()
+        job = claim(kinds, worker)
+        if job is not None:
+            execute(job)
+            continue
+        if once:
+            return
+        if stop is None:
+            time.sleep(settings.JOBS_POLL_INTERVAL)
+        else:
+            stop.wait(settings.JOBS_POLL_INTERVAL)
+
+
+def run_pending(kinds=None):
+    """Выполняет все готовые задачи в текущем процессе (для тестов
+    и разовых запусков)."""
+    work('inline', kinds, once=True)
@@ -41,7 +41,7 @@ class RecipeAdmin(admin.ModelAdmin):
     )
 
     def in_favorite(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
 
 class TagAdmin(admin.ModelAdmin):
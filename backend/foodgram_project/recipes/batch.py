@@ -0,0 +1,201 @@
+"""Пакетное добавление и удаление избранного, списка покупок и подписок.
+
+Строки вставляются одним INSERT ... ON CONFLICT DO NOTHING RETURNING и
+удаляются одним DELETE ... RETURNING (PostgreSQL, SQLite 3.35+): что
+изменилось, видно по возвращённым строкам, без предварительных проверок
+и гонок между ними. Массовые операции не вызывают сигналов моделей,
+поэтому счётчики, суммы списков покупок и ленты подписок обновляются
+здесь явно, одним-двумя запросами на каждую структуру. Число запросов
+не зависит от количества элементов."""
+from django.db import connection, transaction
+
+from recipes.cart import add_to_cart, recipe_amounts
+from recipes.counters import adjust_counter
+from recipes.feed import backfill, remove_authors
+from recipes.models import (Favorite,
+                            Follow,
+                            Recipe,
+                            ShoppingList,
+                            )
+from users.models import User
+
+ADDED = 'added'
+ALREADY_ADDED = 'already_added'
+REMOVED = 'removed'
+NOT_ADDED = 'not_added'
+NOT_FOUND = 'not_found'
+SELF = 'self'
+
+RETURNING_VENDORS = {'postgresql', 'sqlite'}
+
+
+def placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def add_rows(model, user, field, ids, exclude=()):
+    """Вставляет строки (user, field) для существующих объектов одним
+    INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING и возвращает
+    номера действительно добавленных. Одновременные запросы не дают
+    ни дублей, ни IntegrityError: лишняя вставка просто не возвращает
+    строку. Сигналы post_save не вызываются."""
+    if not ids:
+        return []
+    target = model._meta.get_field(field)
+    if connection.vendor not in RETURNING_VENDORS:
+        return add_rows_fallback(model, user, target, ids, exclude)
+    quote = connection.ops.quote_name
+    user_column = quote(model._meta.get_field('user').column)
+    column = quote(target.column)
+    related = target.related_model._meta
+    pk_column = quote(related.pk.column)
+    condition = f'{pk_column} IN ({placeholders(ids)})'
+    if exclude:
+        condition += f' AND {pk_column} NOT IN ({placeholders(exclude)})'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(model._meta.db_table)} '
+            f'({user_column}, {column}) '
+            f'SELECT %s, {pk_column} FROM {quote(related.db_table)} '
+            f'WHERE {condition} '
+            f'ON CONFLICT DO NOTHING RETURNING {column}',
+            (user.pk, *ids, *exclude),
+        )
+        return [pk for pk, in cursor.fetchall()]
+
+
+def add_rows_fallback(model, user, target, ids, exclude):
+    """Для СУБД без INSERT ... RETURNING: проверка и bulk_create."""
+    related = target.related_model
+    found = related.objects.filter(pk__in=ids).exclude(pk__in=exclude)
+    existing = set(
+        model.objects.filter(
+            user=user, **{f'{target.attname}__in': ids}
+        ).values_list(target.attname, flat=True)
+    )
+    added = [
+        pk for pk in found.values_list('pk', flat=True)
+        if pk not in existing
+    ]
+    model.objects.bulk_create(
+        [model(user=user, **{target.attname: pk}) for pk in added],
+        ignore_conflicts=True,
+    )
+    return added
+
+
+def delete_matching(model, field, value, in_field, values):
+    """DELETE FROM ... WHERE field = value AND in_field IN (values)
+    одним запросом, без выборки строк и без сигналов."""
+    quote = connection.ops.quote_name
+    meta = model._meta
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(meta.db_table)} '
+            f'WHERE {quote(meta.get_field(field).column)} = %s '
+            f'AND {quote(meta.get_field(in_field).column)} '
+            f'IN ({placeholders(values)})',
+            (value, *values),
+        )
+
+
+def delete_rows(model, user, field, ids):
+    """Удаляет строки (user, field) одним DELETE ... RETURNING, без
+    сигналов, и возвращает номера объектов, для которых строки были."""
+    if not ids:
+        return []
+    attname = model._meta.get_field(field).attname
+    rows = model.objects.filter(user=user, **{f'{attname}__in': ids})
+    if connection.vendor not in RETURNING_VENDORS:
+        removed = list(rows.values_list(attname, flat=True))
+        if removed:
+            delete_matching(model, 'user', user.pk, field, removed)
+        return removed
+    quote = connection.ops.quote_name
+    column = quote(model._meta.get_field(field).column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} '
+            f'WHERE {quote(model._meta.get_field("user").column)} = %s '
+            f'AND {column} IN ({placeholders(ids)}) '
+            f'RETURNING {column}',
+            (user.pk, *ids),
+        )
+        return [pk for pk, in cursor.fetchall()]
+
+
+def statuses(ids, added, found):
+    """found вызывается, только если добавлено не всё: ей нужно
+    отличить уже добавленные объекты от несуществующих."""
+    added = set(added)
+    if len(added) < len(ids):
+        found = found()
+    return {
+        pk: ADDED if pk in added else ALREADY_ADDED if pk in found
+        else NOT_FOUND
+        for pk in ids
+    }
+
+
+def removal_statuses(ids, removed):
+    removed = set(removed)
+    return {pk: REMOVED if pk in removed else NOT_ADDED for pk in ids}
+
+
+def existing(model, ids):
+    return lambda: set(
+        model.objects.filter(pk__in=ids).values_list('pk', flat=True)
+    )
+
+
+@transaction.atomic
+def add_favorites(user, ids):
+    added = add_rows(Favorite, user, 'recipe', ids)
+    adjust_counter(Recipe, 'favorites_count', added, 1)
+    return statuses(ids, added, existing(Recipe, ids))
+
+
+@transaction.atomic
+def remove_favorites(user, ids):
+    removed = delete_rows(Favorite, user, 'recipe', ids)
+    adjust_counter(Recipe, 'favorites_count', removed, -1)
+    return removal_statuses(ids, removed)
+
+
+@transaction.atomic
+def add_to_shopping_list(user, ids):
+    added = add_rows(ShoppingList, user, 'recipe', ids)
+    if added:
+        adjust_counter(Recipe, 'in_cart_count', added, 1)
+        add_to_cart([user.pk], recipe_amounts(added))
+    return statuses(ids, added, existing(Recipe, ids))
+
+
+@transaction.atomic
+def remove_from_shopping_list(user, ids):
+    removed = delete_rows(ShoppingList, user, 'recipe', ids)
+    if removed:
+        adjust_counter(Recipe, 'in_cart_count', removed, -1)
+        add_to_cart([user.pk], recipe_amounts(removed), sign=-1)
+    return removal_statuses(ids, removed)
+
+
+@transaction.atomic
+def follow_authors(user, ids):
+    added = add_rows(Follow, user, 'author', ids, exclude=[user.pk])
+    if added:
+        adjust_counter(User, 'followers_count', added, 1)
+        backfill(user.pk, added)
+    result = statuses(ids, added, existing(User, ids))
+    if user.pk in result:
+        result[user.pk] = SELF
+    return result
+
+
+@transaction.atomic
+def unfollow_authors(user, ids):
+    removed = delete_rows(Follow, user, 'author', ids)
+    if removed:
+        adjust_counter(User, 'followers_count', removed, -1)
+        remove_authors(user.pk, removed)
+    return removal_statuses(ids, removed)
@@ -0,0 +1,122 @@
+"""Суммы ингредиентов в списках покупок (ShoppingCartItem).
+
+Добавление и удаление рецепта из списка меняют суммы на количество
+ингредиентов рецепта. При изменении состава рецепта суммы затронутых
+пар пользователь/ингредиент пересчитываются заново."""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from recipes.models import IngredientRecipe, ShoppingCartItem
+
+
+def recipe_amounts(recipe_ids):
+    """{ингредиент: количество} для рецептов вместе."""
+    return dict(
+        IngredientRecipe.objects.filter(recipe_id__in=recipe_ids)
+        .values('ingredient')
+        .annotate(total=Sum('amount'))
+        .values_list('ingredient', 'total')
+        .order_by()
+    )
+
+
+def add_to_cart(user_ids, amounts, sign=1):
+    """Прибавляет (sign=1) или вычитает (sign=-1) количества ингредиентов
+    из сумм пользователей: вставка недостающих строк, один UPDATE
+    и удаление обнулившихся строк."""
+    user_ids = list(user_ids)
+    if not user_ids or not amounts:
+        return
+    items = ShoppingCartItem.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=list(amounts)
+    )
+    if sign > 0:
+        ShoppingCartItem.objects.bulk_create(
+            [
+                ShoppingCartItem(
+                    user_id=user_id, ingredient_id=ingredient_id, amount=0
+                )
+                for user_id in user_ids
+                for ingredient_id in amounts
+            ],
+            ignore_conflicts=True,
+        )
+    items.update(amount=F('amount') + Case(
+        *(
+            When(ingredient_id=ingredient_id, then=Value(sign * amount))
+            for ingredient_id, amount in amounts.items()
+        ),
+        output_field=IntegerField(),
+    ))
+    if sign < 0:
+        items.filter(amount__lte=0).delete()
+
+
+def actual_totals(user_ids=None, ingredient_ids=None):
+    """Суммы, посчитанные по спискам покупок и составу рецептов."""
+    rows = IngredientRecipe.objects.all()
+    if user_ids is not None:
+        rows = rows.filter(recipe__shopping__user__in=user_ids)
+    else:
+        rows = rows.filter(recipe__shopping__isnull=False)
+    if ingredient_ids is not None:
+        rows = rows.filter(ingredient__in=ingredient_ids)
+    return rows.values('recipe__shopping__user', 'ingredient').annotate(
+        total=Sum('amount')
+    ).values_list('recipe__shopping__user', 'ingredient', 'total').order_by()
+
+
+def refresh_cart(user_ids, ingredient_ids):
+    """Пересчитывает суммы указанных пользователей и ингредиентов."""
+    user_ids = list(user_ids)
+    ingredient_ids = list(ingredient_ids)
+    if not user_ids or not ingredient_ids:
+        return
+    with transaction.atomic():
+        ShoppingCartItem.objects.filter(
+            user_id__in=user_ids, ingredient_id__in=ingredient_ids
+        ).delete()
+        ShoppingCartItem.objects.bulk_create(
+            ShoppingCartItem(
+                user_id=user_id, ingredient_id=ingredient_id, amount=total
+            )
+            for user_id, ingredient_id, total
+            in actual_totals(user_ids, ingredient_ids)
+            if total > 0
+        )
+
+
+def find_cart_mismatches():
+    """Пары (пользователь, ингредиент), у которых сохранённая сумма
+    расходится с посчитанной: {(user_id, ingredient_id): (было, надо)}.
+    Отсутствующая строка равносильна нулевой сумме."""
+    stored = {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount
+        in ShoppingCartItem.objects.values_list(
+            'user_id', 'ingredient_id', 'amount'
+        ).iterator()
+    }
+    mismatches = {}
+    for user_id, ingredient_id, total in actual_totals().iterator():
+        amount = stored.pop((user_id, ingredient_id), 0)
+        if amount != total:
+            mismatches[user_id, ingredient_id] = (amount, total)
+    for key, amount in stored.items():
+        if amount:
+            mismatches[key] = (amount, 0)
+    return mismatches
+
+
+def rebuild_carts():
+    ShoppingCartItem.objects.all().delete()
+    ShoppingCartItem.objects.bulk_create(
+        (
+            ShoppingCartItem(
+                user_id=user_id, ingredient_id=ingredient_id, amount=total
+            )
+            for user_id, ingredient_id, total in actual_totals().iterator()
+            if total > 0
+        ),
+        batch_size=1000,
+    )
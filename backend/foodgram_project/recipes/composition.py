@@ -0,0 +1,53 @@
+"""Запись состава рецепта (IngredientRecipe).
+
+Новый состав сравнивается с сохранённым, и в БД уходят только отличия:
+один bulk_create для новых ингредиентов, один bulk_update для
+изменившихся количеств и один DELETE для убранных. Массовые операции
+не вызывают сигналов, поэтому суммы списков покупок обновляются здесь
+явно. Поисковый индекс и кеш рецепта обновляются обработчиками
+сохранения самого рецепта, которое выполняется в той же транзакции."""
+from recipes.batch import delete_matching
+from recipes.cart import refresh_cart
+from recipes.models import IngredientRecipe, ShoppingList
+
+
+def set_ingredients(recipe, amounts, created=False):
+    """Приводит состав рецепта к {ингредиент: количество}.
+    Для только что созданного рецепта сравнение пропускается."""
+    current = {}
+    if not created:
+        current = {
+            row.ingredient_id: row
+            for row in IngredientRecipe.objects.filter(recipe=recipe).only(
+                'pk', 'ingredient_id', 'amount'
+            )
+        }
+    added = [
+        IngredientRecipe(recipe=recipe, ingredient_id=pk, amount=amount)
+        for pk, amount in amounts.items()
+        if pk not in current
+    ]
+    changed = []
+    for pk, row in current.items():
+        if pk in amounts and row.amount != amounts[pk]:
+            row.amount = amounts[pk]
+            changed.append(row)
+    removed = [pk for pk in current if pk not in amounts]
+    if added:
+        IngredientRecipe.objects.bulk_create(added)
+    if changed:
+        IngredientRecipe.objects.bulk_update(changed, ['amount'])
+    if removed:
+        delete_matching(
+            IngredientRecipe, 'recipe', recipe.pk, 'ingredient', removed
+        )
+    if created:
+        return
+    touched = [row.ingredient_id for row in added + changed] + removed
+    if touched:
+        refresh_cart(
+            ShoppingList.objects.filter(recipe=recipe).values_list(
+                'user_id', flat=True
+            ),
+            touched,
+        )
@@ -0,0 +1,42 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Follow, Recipe, ShoppingList
+from users.models import User
+
+# (модель со счётчиком, поле счётчика, модель строк, поле связи)
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_cart_count', ShoppingList, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
+
+
+def adjust_counter(model, field, pks, delta):
+    """Изменяет счётчик у перечисленных строк одним UPDATE."""
+    if pks and delta:
+        model.objects.filter(pk__in=pks).update(**{field: F(field) + delta})
+
+
+def actual_count(source, relation):
+    return Coalesce(
+        Subquery(
+            source.objects.filter(**{relation: OuterRef('pk')})
+            .order_by()
+            .values(relation)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        Value(0),
+    )
+
+
+def find_mismatches(model, field, source, relation):
+    return model.objects.annotate(
+        actual=actual_count(source, relation)
+    ).exclude(**{field: F('actual')})
+
+
+def rebuild_counter(model, field, source, relation):
+    return model.objects.update(**{field: actual_count(source, relation)})
@@ -0,0 +1,151 @@
+"""Лента подписок (FeedEntry).
+
+Опубликованный рецепт раскладывается по лентам подписчиков автора
+пачками по FEED_BATCH_SIZE строк. Для авторов, у которых подписчиков
+больше FEED_FANOUT_LIMIT, раскладка не делается: их новые рецепты
+забирает в свою ленту сам читатель при её открытии (pull_feed), так что
+чтение ленты всегда остаётся выборкой по индексу (user, created).
+Follow.feed_synced_at отмечает, до какого момента рецепты автора
+забраны; пока отметка есть, pull_feed забирает автора, даже если
+подписчиков у него стало меньше."""
+from collections import defaultdict
+from datetime import timedelta
+from itertools import chain
+
+from django.conf import settings
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from recipes.models import FeedEntry, Follow, Recipe
+
+# Рецепт мог быть создан чуть раньше, чем зафиксирована его транзакция,
+# поэтому окно забора перекрывает предыдущее.
+PULL_OVERLAP = timedelta(minutes=5)
+
+
+def entries_for(user_ids, recipes):
+    return [
+        FeedEntry(
+            user_id=user_id,
+            recipe_id=recipe.pk,
+            author_id=recipe.author_id,
+            created=recipe.created,
+        )
+        for user_id in user_ids
+        for recipe in recipes
+    ]
+
+
+def fan_out(recipe_id):
+    """Добавляет рецепт в ленты подписчиков автора."""
+    recipe = Recipe.objects.filter(pk=recipe_id).select_related(
+        'author'
+    ).only('pk', 'created', 'author__followers_count').first()
+    if recipe is None:
+        return
+    if recipe.author.followers_count > settings.FEED_FANOUT_LIMIT:
+        return
+    followers = Follow.objects.filter(
+        author_id=recipe.author_id
+    ).values_list('user_id', flat=True).order_by('pk')
+    batch = []
+    for user_id in followers.iterator(chunk_size=settings.FEED_BATCH_SIZE):
+        batch.append(user_id)
+        if len(batch) == settings.FEED_BATCH_SIZE:
+            FeedEntry.objects.bulk_create(
+                entries_for(batch, [recipe]), ignore_conflicts=True
+            )
+            batch = []
+    if batch:
+        FeedEntry.objects.bulk_create(
+            entries_for(batch, [recipe]), ignore_conflicts=True
+        )
+
+
+def latest_recipes(author_ids, limit, fields):
+    """Последние limit рецептов каждого автора одним запросом:
+    ROW_NUMBER() по разделам author_id, отбор по номеру строки.
+    Возвращает {author_id: [рецепты, новые первыми]}."""
+    recipes = defaultdict(list)
+    if not author_ids or not limit:
+        return recipes
+    ranked = Recipe.objects.filter(author_id__in=author_ids).annotate(
+        recipe_rank=Window(
+            RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=[F('created').desc(), F('id').desc()],
+        )
+    ).order_by().values(*fields, 'recipe_rank')
+    sql, params = ranked.query.sql_with_params()
+    for recipe in Recipe.objects.raw(
+        f'SELECT * FROM ({sql}) ranked WHERE recipe_rank <= %s '
+        'ORDER BY author_id, recipe_rank',
+        (*params, limit),
+    ):
+        recipes[recipe.author_id].append(recipe)
+    return recipes
+
+
+def backfill(user_id, author_ids):
+    """Последние рецепты авторов в ленту нового подписчика."""
+    recipes = latest_recipes(
+        author_ids, settings.FEED_BACKFILL, ('id', 'author_id', 'created')
+    )
+    FeedEntry.objects.bulk_create(
+        entries_for([user_id], chain.from_iterable(recipes.values())),
+        ignore_conflicts=True,
+    )
+    Follow.objects.filter(user_id=user_id, author_id__in=author_ids).update(
+        feed_synced_at=timezone.now()
+    )
+
+
+def remove_authors(user_id, author_ids):
+    FeedEntry.objects.filter(
+        user_id=user_id, author_id__in=author_ids
+    ).delete()
+
+
+def pull_feed(user):
+    """Забирает в ленту новые рецепты авторов, для которых раскладка
+    при публикации не выполняется.
+
+    Автор, у которого подписчиков стало не больше FEED_FANOUT_LIMIT,
+    забирается ещё один раз: рецепты, опубликованные до этого без
+    раскладки, иначе не попали бы в ленту. После этого feed_synced_at
+    сбрасывается, и новые рецепты автора приходят раскладкой."""
+    follows = list(
+        Follow.objects.filter(
+            Q(author__followers_count__gt=settings.FEED_FANOUT_LIMIT)
+            | Q(feed_synced_at__isnull=False),
+            user=user,
+        ).values_list(
+            'pk', 'author_id', 'feed_synced_at', 'author__followers_count'
+        )
+    )
+    if not follows:
+        return
+    now = timezone.now()
+    condition = Q()
+    for _, author_id, synced_at, _ in follows:
+        if synced_at is None:
+            condition |= Q(author_id=author_id)
+        else:
+            condition |= Q(
+                author_id=author_id, created__gt=synced_at - PULL_OVERLAP
+            )
+    recipes = Recipe.objects.filter(condition).only(
+        'pk', 'author_id', 'created'
+    ).order_by('-created', '-id')[:settings.FEED_BACKFILL * len(follows)]
+    FeedEntry.objects.bulk_create(
+        entries_for([user.pk], recipes), ignore_conflicts=True
+    )
+    pulled = {
+        pk for pk, _, _, followers_count in follows
+        if followers_count > settings.FEED_FANOUT_LIMIT
+    }
+    Follow.objects.filter(pk__in=pulled).update(feed_synced_at=now)
+    Follow.objects.filter(
+        pk__in=[pk for pk, _, _, _ in follows if pk not in pulled]
+    ).update(feed_synced_at=None)
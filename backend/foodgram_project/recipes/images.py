@@ -0,0 +1,131 @@
+"""Уменьшенные копии картинок рецептов.
+
+Для каждой картинки строятся копии VARIANTS в форматах FORMATS:
+card для карточек в списках, retina — она же для экранов с двойной
+плотностью, detail для страницы рецепта. Копии лежат в папке, имя
+которой зависит от исходного файла, поэтому их можно кешировать
+навсегда. Пути хранятся в Recipe.image_variants вместе с именем
+исходного файла: если картинку заменили, а копии ещё не готовы,
+клиенты получают только оригинал.
+
+Копии строит фоновая задача recipes.image_variants (см. recipes.jobs),
+а не поток запроса."""
+import hashlib
+import io
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from jobs.queue import enqueue
+from recipes.models import Recipe
+
+# Имя: (размер, обрезать ли до точного размера). Без обрезки картинка
+# вписывается в размер и не увеличивается.
+VARIANTS = {
+    'card': ((400, 300), True),
+    'retina': ((800, 600), True),
+    'detail': ((1200, 900), False),
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+VARIANTS_DIR = 'recipe/variants'
+BACKGROUND = (255, 255, 255)
+
+
+def variant_paths(recipe):
+    """{имя: {формат: путь}} для текущей картинки рецепта или None,
+    если копии ещё не построены."""
+    variants = recipe.image_variants or {}
+    if not recipe.image or variants.get('source') != recipe.image.name:
+        return None
+    return {name: variants[name] for name in VARIANTS if name in variants}
+
+
+def resize(image, size, crop):
+    if crop:
+        return ImageOps.fit(image, size, Image.LANCZOS)
+    image = image.copy()
+    image.thumbnail(size, Image.LANCZOS)
+    return image
+
+
+def flatten(image):
+    """RGB без прозрачности: прозрачные места заливаются белым."""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, BACKGROUND)
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_variants(recipe):
+    """Строит копии картинки рецепта и возвращает новое значение
+    image_variants."""
+    source = recipe.image.name
+    digest = hashlib.sha256(source.encode()).hexdigest()[:16]
+    folder = f'{VARIANTS_DIR}/{recipe.pk}/{digest}'
+    variants = {'source': source}
+    with recipe.image.open('rb') as file, Image.open(file) as original:
+        image = flatten(original)
+    for name, (size, crop) in VARIANTS.items():
+        resized = resize(image, size, crop)
+        variants[name] = {}
+        for extension, (image_format, options) in FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(buffer, image_format, **options)
+            variants[name][extension] = default_storage.save(
+                f'{folder}/{name}.{extension}', ContentFile(buffer.getvalue())
+            )
+    return variants
+
+
+def stored_files(variants):
+    return {
+        path
+        for name in VARIANTS
+        for path in (variants or {}).get(name, {}).values()
+    }
+
+
+def build_variants(recipe_id, force=False):
+    """Строит копии картинки рецепта, если они устарели или force.
+    Возвращает True, если копии были построены."""
+    recipe = Recipe.objects.filter(pk=recipe_id).only(
+        'pk', 'image', 'image_variants'
+    ).first()
+    if recipe is None or not recipe.image:
+        return False
+    if not force and variant_paths(recipe) is not None:
+        return False
+    previous = recipe.image_variants
+    variants = render_variants(recipe)
+    with transaction.atomic():
+        # Пока копии строились, картинку могли заменить ещё раз:
+        # тогда эти копии не нужны, новые построит следующий вызов.
+        current = Recipe.objects.select_for_update().filter(
+            pk=recipe_id, image=recipe.image.name
+        ).exists()
+        if current:
+            recipe.image_variants = variants
+            recipe.save(update_fields=['image_variants'])
+    unused = (
+        stored_files(previous) - stored_files(variants) if current
+        else stored_files(variants)
+    )
+    for path in unused:
+        default_storage.delete(path)
+    return current
+
+
+def schedule_variants(recipe_id):
+    """Ставит построение копий в очередь в текущей транзакции;
+    повторные сохранения до начала задачи её не дублируют."""
+    enqueue(
+        'recipes.image_variants', {'recipe_id': recipe_id}, key=str(recipe_id)
+    )
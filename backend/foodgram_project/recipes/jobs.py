@@ -0,0 +1,29 @@
+"""Фоновые задачи рецептов (см. jobs.queue)."""
+from django.db import transaction
+
+from jobs.queue import register
+from recipes.counters import COUNTERS, find_mismatches, rebuild_counter
+from recipes.feed import fan_out
+from recipes.images import build_variants
+
+
+@register('recipes.image_variants')
+def image_variants(recipe_id):
+    return {'built': build_variants(recipe_id)}
+
+
+@register('recipes.fan_out')
+def feed_fan_out(recipe_id):
+    fan_out(recipe_id)
+
+
+@register('recipes.rebuild_counters')
+def rebuild_counters():
+    """Пересчитывает счётчики, в которых найдены расхождения."""
+    rebuilt = []
+    for model, field, source, relation in COUNTERS:
+        if find_mismatches(model, field, source, relation).exists():
+            with transaction.atomic():
+                rebuild_counter(model, field, source, relation)
+            rebuilt.append(f'{model._meta.model_name}.{field}')
+    return {'rebuilt': rebuilt}
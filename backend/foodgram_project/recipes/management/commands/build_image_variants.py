@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import build_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Строит уменьшенные копии картинок рецептов, у которых '
+            'их нет или они устарели.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Перестроить копии всех картинок.',
+        )
+
+    def handle(self, *args, **options):
+        recipe_ids = Recipe.objects.exclude(image='').values_list(
+            'pk', flat=True
+        ).order_by('pk')
+        built = failed = 0
+        for recipe_id in recipe_ids.iterator():
+            try:
+                built += build_variants(recipe_id, force=options['force'])
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'рецепт {recipe_id}: {error}')
+        self.stdout.write(f'построено: {built}, ошибок: {failed}')
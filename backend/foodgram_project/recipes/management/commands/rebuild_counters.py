@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from jobs.queue import enqueue
+from recipes.counters import COUNTERS, find_mismatches, rebuild_counter
+
+
+class Command(BaseCommand):
+    help = ('Проверяет и пересчитывает счётчики избранного, списков покупок, '
+            'рецептов и подписчиков.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить счётчики, ничего не изменяя.',
+        )
+        parser.add_argument(
+            '--background',
+            action='store_true',
+            help='Поставить пересчёт в очередь фоновых задач.',
+        )
+
+    def handle(self, *args, **options):
+        if options['background']:
+            enqueue('recipes.rebuild_counters', key='all')
+            self.stdout.write('пересчёт поставлен в очередь')
+            return
+        total = 0
+        for model, field, source, relation in COUNTERS:
+            mismatches = find_mismatches(model, field, source, relation)
+            count = mismatches.count()
+            total += count
+            self.stdout.write(
+                f'{model._meta.model_name}.{field}: расхождений {count}'
+            )
+            if count and not options['check']:
+                with transaction.atomic():
+                    rebuild_counter(model, field, source, relation)
+                self.stdout.write(f'{model._meta.model_name}.{field}: '
+                                  'пересчитано')
+        if total and options['check']:
+            raise CommandError(f'Найдено расхождений: {total}')
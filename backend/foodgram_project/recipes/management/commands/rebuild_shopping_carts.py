@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.cart import find_cart_mismatches, rebuild_carts
+
+
+class Command(BaseCommand):
+    help = ('Сверяет суммы ингредиентов в списках покупок с подсчётом '
+            'по рецептам и пересобирает их при расхождении.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить суммы, ничего не изменяя.',
+        )
+
+    def handle(self, *args, **options):
+        mismatches = find_cart_mismatches()
+        for (user_id, ingredient_id), (stored, actual) in sorted(
+            mismatches.items()
+        )[:20]:
+            self.stdout.write(
+                f'пользователь {user_id}, ингредиент {ingredient_id}: '
+                f'{stored} вместо {actual}'
+            )
+        self.stdout.write(f'расхождений: {len(mismatches)}')
+        if not mismatches:
+            return
+        if options['check']:
+            raise CommandError(f'Найдено расхождений: {len(mismatches)}')
+        with transaction.atomic():
+            rebuild_carts()
+        self.stdout.write('суммы пересобраны')
@@ -0,0 +1,45 @@
+# Generated by Django 3.1.4 on 2026-10-18 16:47
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+MAX_TAG_BITS = 63
+
+
+def fill_tags_mask(apps, schema_editor):
+    Tag = apps.get_model('recipes', 'Tag')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    bits = {}
+    for bit, tag in enumerate(Tag.objects.order_by('pk')[:MAX_TAG_BITS]):
+        tag.bit = bit
+        tag.save(update_fields=['bit'])
+        bits[tag.pk] = bit
+    masks = defaultdict(int)
+    rows = Recipe.tags.through.objects.values_list('recipe_id', 'tag_id')
+    for recipe_id, tag_id in rows:
+        if tag_id in bits:
+            masks[recipe_id] |= 1 << bits[tag_id]
+    for recipe_id, mask in masks.items():
+        Recipe.objects.filter(pk=recipe_id).update(tags_mask=mask)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_auto_20261018_1645'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Битовая маска тегов'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, null=True, unique=True, verbose_name='Номер бита в маске тегов рецепта'),
+        ),
+        migrations.RunPython(fill_tags_mask, migrations.RunPython.noop),
+    ]
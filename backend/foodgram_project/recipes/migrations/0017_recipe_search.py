@@ -0,0 +1,64 @@
+# Generated by Django 3.1.4 on 2026-10-18 16:50
+
+from django.db import migrations
+
+INGREDIENT_NAMES_SQL = (
+    'SELECT {aggregate} FROM recipes_ingredientrecipe ir '
+    'JOIN recipes_ingredient i ON i.id = ir.ingredient_id '
+    'WHERE ir.recipe_id = recipes_recipe.id'
+)
+
+POSTGRESQL_FORWARD = (
+    'ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector',
+    'CREATE INDEX recipe_search_vector_idx '
+    'ON recipes_recipe USING GIN (search_vector)',
+    "UPDATE recipes_recipe SET search_vector = "
+    "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(text, '')), 'B') || "
+    "setweight(to_tsvector('russian', coalesce(({}), '')), 'C')".format(
+        INGREDIENT_NAMES_SQL.format(aggregate="string_agg(i.name, ' ')")
+    ),
+)
+POSTGRESQL_BACKWARD = (
+    'ALTER TABLE recipes_recipe DROP COLUMN search_vector',
+)
+
+SQLITE_FORWARD = (
+    'CREATE VIRTUAL TABLE recipes_recipe_fts '
+    "USING fts5(name, text, ingredients, tokenize='unicode61')",
+    'INSERT INTO recipes_recipe_fts (rowid, name, text, ingredients) '
+    "SELECT id, name, text, coalesce(({}), '') FROM recipes_recipe".format(
+        INGREDIENT_NAMES_SQL.format(aggregate="group_concat(i.name, ' ')")
+    ),
+)
+SQLITE_BACKWARD = (
+    'DROP TABLE recipes_recipe_fts',
+)
+
+
+def run(statements):
+    def execute(apps, schema_editor):
+        vendor_statements = statements.get(schema_editor.connection.vendor)
+        for statement in vendor_statements or ():
+            schema_editor.execute(statement)
+    return execute
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_auto_20261018_1647'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({
+                'postgresql': POSTGRESQL_FORWARD,
+                'sqlite': SQLITE_FORWARD,
+            }),
+            run({
+                'postgresql': POSTGRESQL_BACKWARD,
+                'sqlite': SQLITE_BACKWARD,
+            }),
+        ),
+    ]
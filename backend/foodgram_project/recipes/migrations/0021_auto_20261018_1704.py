@@ -0,0 +1,51 @@
+# Generated by Django 3.1.4 on 2026-10-18 17:04
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    Follow = apps.get_model('recipes', 'Follow')
+    User = apps.get_model('users', 'User')
+    duplicates = list(
+        Follow.objects.values('user', 'author')
+        .annotate(keep=Min('pk'), total=Count('pk'))
+        .filter(total__gt=1)
+        .values_list('user', 'author', 'keep')
+        .order_by()
+    )
+    for user_id, author_id, keep in duplicates:
+        Follow.objects.filter(user=user_id, author=author_id).exclude(
+            pk=keep
+        ).delete()
+    if duplicates:
+        User.objects.filter(
+            pk__in={author_id for _, author_id, _ in duplicates}
+        ).update(followers_count=Coalesce(
+            Subquery(
+                Follow.objects.filter(author=OuterRef('pk'))
+                .order_by()
+                .values('author')
+                .annotate(total=Count('pk'))
+                .values('total')
+            ),
+            Value(0),
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0020_auto_20261018_1701'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicate_follows, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follow_user_author'),
+        ),
+    ]
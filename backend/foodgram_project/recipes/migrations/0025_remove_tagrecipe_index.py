@@ -0,0 +1,17 @@
+# Generated by Django 3.1.4 on 2026-10-18 17:34
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0024_ingredient_updated'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='tagrecipe',
+            name='tagrecipe_tag_recipe_idx',
+        ),
+    ]
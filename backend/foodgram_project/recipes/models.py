@@ -1,5 +1,7 @@
+import uuid
+
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 
 from users.models import User
@@ -8,6 +10,18 @@ FIELDS_RECIPE_MODELS_MAX_LENGTH: int = 200
 FIELD_COLOR_MAX_LENGTH: int = 16
 
 
+class AtomicSaveModel(models.Model):
+    """Модель, сохранение которой выполняется в транзакции вместе
+    с обработчиками post_save (например, обновлением счётчиков)."""
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
 class Tag(models.Model):
     """Тег"""
     name = models.CharField(
@@ -20,6 +34,12 @@ class Tag(models.Model):
         max_length=FIELDS_RECIPE_MODELS_MAX_LENGTH,
         verbose_name='Адрес тега',
     )
+    bit = models.PositiveSmallIntegerField(
+        unique=True,
+        null=True,
+        editable=False,
+        verbose_name='Номер бита в маске тегов рецепта',
+    )
 
     class Meta:
         verbose_name = 'Тег'
@@ -47,17 +67,28 @@ class Ingredient(models.Model):
             MaxValueValidator(settings.MAX_VALUE)
         ],
     )
+    updated = models.DateTimeField(
+        auto_now=True,
+        db_index=True,
+        verbose_name='Изменён',
+    )
 
     class Meta:
         ordering = ('name',)
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient_name_unit'
+            )
+        ]
 
     def __str__(self):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(AtomicSaveModel):
     """Рецепт"""
     author = models.ForeignKey(
         User,
@@ -107,9 +138,34 @@ class Recipe(models.Model):
         auto_now_add=True,
         help_text='Дата публикации',
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном',
+    )
+    in_cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок',
+    )
+    tags_mask = models.BigIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Битовая маска тегов',
+    )
+    image_variants = models.JSONField(
+        default=dict,
+        editable=False,
+        verbose_name='Уменьшенные копии картинки',
+    )
 
     class Meta:
         ordering = ('-created',)
+        indexes = [
+            models.Index(
+                fields=('-created', '-id'), name='recipe_created_id_idx'
+            ),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -170,7 +226,7 @@ class TagRecipe(models.Model):
         verbose_name_plural = 'Теги/Рецепты'
 
 
-class Favorite(models.Model):
+class Favorite(AtomicSaveModel):
     """Добавить Рецепт в избранное."""
     user = models.ForeignKey(
         User,
@@ -200,7 +256,7 @@ class Favorite(models.Model):
                 f'в избранное пользователем {self.user}')
 
 
-class Follow(models.Model):
+class Follow(AtomicSaveModel):
     """Подписаться на Пользователя."""
     user = models.ForeignKey(
         User,
@@ -216,9 +272,20 @@ class Follow(models.Model):
         verbose_name='Автора',
         help_text='Вы можете подписаться на этого автора',
     )
+    feed_synced_at = models.DateTimeField(
+        null=True,
+        editable=False,
+        verbose_name='Рецепты автора забраны в ленту до',
+    )
 
     class Meta:
         verbose_name_plural = 'Подписки'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'author'),
+                name='unique_follow_user_author'
+            )
+        ]
 
     def __str__(self):
         return (
@@ -226,7 +293,7 @@ class Follow(models.Model):
         )
 
 
-class ShoppingList(models.Model):
+class ShoppingList(AtomicSaveModel):
     """Список покупок"""
     user = models.ForeignKey(
         User,
@@ -248,3 +315,117 @@ class ShoppingList(models.Model):
     def __str__(self):
         return (f'Рецепт {self.recipe} был добавлен '
                 f'в список покупок пользователем {self.user}')
+
+
+class ShoppingCartItem(models.Model):
+    """Суммарное количество ингредиента в списке покупок пользователя.
+
+    Поддерживается обработчиками изменений списка покупок и состава
+    рецептов, сверяется командой rebuild_shopping_carts."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='cart_items',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='cart_items',
+        verbose_name='Ингредиент',
+    )
+    amount = models.IntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name_plural = 'Ингредиенты в списках покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_cart_item_user_ingredient'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} {self.amount}'
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписок пользователя.
+
+    Строки пишутся при публикации рецепта для каждого подписчика автора.
+    Рецепты авторов с очень большим числом подписчиков забираются
+    в ленту при её чтении (см. recipes.feed)."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Читатель',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    created = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_entry_user_recipe'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-created', '-recipe'),
+                name='feedentry_user_created_idx',
+            ),
+            models.Index(
+                fields=('user', 'author'), name='feedentry_user_author_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
+
+
+class ImageUpload(models.Model):
+    """Картинка рецепта, загруженная отдельно от рецепта.
+
+    Рецепт ссылается на неё токеном вместо передачи картинки в base64;
+    невостребованные загрузки удаляет команда clear_image_uploads."""
+    token = models.UUIDField(
+        default=uuid.uuid4,
+        unique=True,
+        editable=False,
+        verbose_name='Токен',
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='image_uploads',
+        verbose_name='Пользователь',
+    )
+    image = models.ImageField(
+        upload_to='recipe/',
+        verbose_name='Картинка',
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Дата загрузки',
+    )
+
+    class Meta:
+        verbose_name_plural = 'Загруженные картинки'
+
+    def __str__(self):
+        return f'{self.image.name} ({self.user})'
@@ -0,0 +1,125 @@
+"""Полнотекстовый поиск рецептов по названию, описанию и ингредиентам.
+
+На PostgreSQL индекс хранится в колонке recipes_recipe.search_vector
+(tsvector с GIN-индексом), на SQLite — в виртуальной таблице FTS5
+recipes_recipe_fts. Обе структуры создаются миграцией и не описаны
+в модели, поэтому работа с ними идёт через SQL. Индекс обновляется
+сигналами после фиксации транзакции."""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+
+INGREDIENT_NAMES_SQL = (
+    'SELECT {aggregate} FROM recipes_ingredientrecipe ir '
+    'JOIN recipes_ingredient i ON i.id = ir.ingredient_id '
+    'WHERE ir.recipe_id = recipes_recipe.id'
+)
+
+POSTGRESQL_UPDATE_SQL = (
+    'UPDATE recipes_recipe SET search_vector = '
+    "setweight(to_tsvector(%s, coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector(%s, coalesce(text, '')), 'B') || "
+    "setweight(to_tsvector(%s, coalesce(({ingredients}), '')), 'C') "
+    'WHERE id IN ({ids})'
+)
+
+SQLITE_DELETE_SQL = 'DELETE FROM recipes_recipe_fts WHERE rowid IN ({ids})'
+SQLITE_INSERT_SQL = (
+    'INSERT INTO recipes_recipe_fts (rowid, name, text, ingredients) '
+    "SELECT id, name, text, coalesce(({ingredients}), '') "
+    'FROM recipes_recipe WHERE id IN ({ids})'
+)
+
+
+def update_search_index(recipe_ids):
+    """Перестраивает поисковый индекс для перечисленных рецептов."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    ids = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                POSTGRESQL_UPDATE_SQL.format(
+                    ingredients=INGREDIENT_NAMES_SQL.format(
+                        aggregate="string_agg(i.name, ' ')"
+                    ),
+                    ids=ids,
+                ),
+                [SEARCH_CONFIG] * 3 + recipe_ids,
+            )
+        elif connection.vendor == 'sqlite':
+            cursor.execute(SQLITE_DELETE_SQL.format(ids=ids), recipe_ids)
+            cursor.execute(
+                SQLITE_INSERT_SQL.format(
+                    ingredients=INGREDIENT_NAMES_SQL.format(
+                        aggregate="group_concat(i.name, ' ')"
+                    ),
+                    ids=ids,
+                ),
+                recipe_ids,
+            )
+
+
+def remove_from_search_index(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids or connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            SQLITE_DELETE_SQL.format(ids=', '.join(['%s'] * len(recipe_ids))),
+            recipe_ids,
+        )
+
+
+def fts5_query(query):
+    """Запрос FTS5 из пользовательского ввода: все слова, с префиксами."""
+    words = re.findall(r'\w+', query)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_recipes(queryset, query):
+    """Рецепты, подходящие под запрос, с аннотацией search_rank
+    (чем больше, тем релевантнее), отсортированные по релевантности."""
+    if connection.vendor == 'postgresql':
+        tsquery = 'websearch_to_tsquery(%s, %s)'
+        matches = RawSQL(
+            f'"recipes_recipe"."search_vector" @@ {tsquery}',
+            (SEARCH_CONFIG, query),
+            output_field=BooleanField(),
+        )
+        rank = RawSQL(
+            f'ts_rank("recipes_recipe"."search_vector", {tsquery})',
+            (SEARCH_CONFIG, query),
+            output_field=FloatField(),
+        )
+    elif connection.vendor == 'sqlite':
+        match = fts5_query(query)
+        if not match:
+            return queryset.none()
+        matches = RawSQL(
+            f'"recipes_recipe"."id" IN (SELECT rowid FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s)',
+            (match,),
+            output_field=BooleanField(),
+        )
+        rank = RawSQL(
+            f'(SELECT -bm25({FTS_TABLE}, 10.0, 5.0, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = "recipes_recipe"."id")',
+            (match,),
+            output_field=FloatField(),
+        )
+    else:
+        return queryset.filter(
+            Q(name__icontains=query) | Q(text__icontains=query)
+        ).annotate(
+            search_rank=Value(1.0, output_field=FloatField())
+        ).order_by('-search_rank', '-id')
+    return queryset.filter(matches).annotate(
+        search_rank=rank
+    ).order_by('-search_rank', '-id')
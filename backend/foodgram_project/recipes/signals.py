@@ -0,0 +1,178 @@
+from django.db.models.signals import (m2m_changed,
+                                      post_delete,
+                                      post_save,
+                                      pre_delete,
+                                      pre_save,
+                                      )
+from django.db import transaction
+from django.dispatch import receiver
+
+from jobs.queue import enqueue
+from recipes.cart import add_to_cart, recipe_amounts, refresh_cart
+from recipes.counters import COUNTERS, adjust_counter
+from recipes.feed import backfill, remove_authors
+from recipes.images import schedule_variants, variant_paths
+from recipes.models import (Follow,
+                            Ingredient,
+                            IngredientRecipe,
+                            Recipe,
+                            ShoppingList,
+                            Tag,
+                            )
+from recipes.search import remove_from_search_index, update_search_index
+from recipes.tags import assign_free_bits, clear_tag_bit, update_tags_mask
+
+
+def connect_counter(model, field, source, relation):
+    """Поддерживает счётчик field модели model равным числу строк source.
+
+    Обработчики срабатывают и при массовом удалении через QuerySet.delete()
+    и выполняются в транзакции удаления. Сохранение моделей-источников
+    обёрнуто в транзакцию в AtomicSaveModel."""
+    attname = source._meta.get_field(relation).attname
+
+    def created(sender, instance, created, **kwargs):
+        if created:
+            adjust_counter(model, field, [getattr(instance, attname)], 1)
+
+    def deleted(sender, instance, **kwargs):
+        adjust_counter(model, field, [getattr(instance, attname)], -1)
+
+    uid = f'{field}_counter'
+    post_save.connect(created, sender=source, weak=False, dispatch_uid=uid)
+    post_delete.connect(deleted, sender=source, weak=False, dispatch_uid=uid)
+
+
+for counter in COUNTERS:
+    connect_counter(*counter)
+
+
+@receiver(post_save, sender=Tag)
+def assign_tag_bit(sender, instance, created, **kwargs):
+    """Бит выдаётся после вставки: тег сохраняется без бита, поэтому
+    одновременное создание тегов не упирается в уникальный индекс."""
+    if created and instance.bit is None:
+        assign_free_bits()
+        instance.bit = Tag.objects.values_list('bit', flat=True).get(
+            pk=instance.pk
+        )
+
+
+@receiver(pre_delete, sender=Tag)
+def release_tag_bit(sender, instance, **kwargs):
+    clear_tag_bit(instance)
+
+
+@receiver(post_delete, sender=Tag)
+def reuse_tag_bit(sender, instance, **kwargs):
+    """Освободившийся бит получает самый старый тег без бита."""
+    if instance.bit is not None:
+        assign_free_bits()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Поддерживает Recipe.tags_mask при recipe.tags.set()/add()/remove()
+    и при изменении связей со стороны тега."""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            update_tags_mask([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        update_tags_mask(pk_set)
+    elif action == 'pre_clear':
+        clear_tag_bit(instance)
+
+
+def schedule_search_update(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    transaction.on_commit(lambda: update_search_index(recipe_ids))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, update_fields, **kwargs):
+    if update_fields is None or {'name', 'text'} & set(update_fields):
+        schedule_search_update([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    recipe_ids = [instance.pk]
+    transaction.on_commit(lambda: remove_from_search_index(recipe_ids))
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    schedule_search_update([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, created, **kwargs):
+    if not created:
+        schedule_search_update(
+            instance.ingredient_in_recipe.values_list('recipe_id', flat=True)
+        )
+
+
+@receiver(post_save, sender=ShoppingList)
+def cart_recipe_added(sender, instance, created, **kwargs):
+    if created:
+        add_to_cart([instance.user_id], recipe_amounts([instance.recipe_id]))
+
+
+@receiver(pre_delete, sender=ShoppingList)
+def cart_recipe_removed(sender, instance, **kwargs):
+    """pre_delete: при каскадном удалении рецепта его ингредиенты
+    к post_delete могут быть уже удалены."""
+    add_to_cart(
+        [instance.user_id], recipe_amounts([instance.recipe_id]), sign=-1
+    )
+
+
+@receiver(pre_save, sender=IngredientRecipe)
+def remember_cart_ingredient(sender, instance, **kwargs):
+    instance.previous_ingredient_id = None
+    if instance.pk is not None:
+        instance.previous_ingredient_id = IngredientRecipe.objects.filter(
+            pk=instance.pk
+        ).values_list('ingredient_id', flat=True).first()
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def recipe_ingredient_cart_changed(sender, instance, **kwargs):
+    ingredient_ids = {
+        instance.ingredient_id,
+        getattr(instance, 'previous_ingredient_id', None),
+    } - {None}
+    refresh_cart(
+        ShoppingList.objects.filter(
+            recipe_id=instance.recipe_id
+        ).values_list('user_id', flat=True),
+        ingredient_ids,
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(sender, instance, created, **kwargs):
+    if created:
+        enqueue('recipes.fan_out', {'recipe_id': instance.pk})
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, update_fields, **kwargs):
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    if instance.image and variant_paths(instance) is None:
+        schedule_variants(instance.pk)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        backfill(instance.user_id, [instance.author_id])
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    remove_authors(instance.user_id, [instance.author_id])
@@ -0,0 +1,86 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from recipes.models import Recipe, Tag
+
+# Маска хранится в знаковом BigIntegerField, старший бит не используется.
+MAX_TAG_BITS: int = 63
+
+
+def next_free_bit():
+    """Младший свободный бит или None, если все биты заняты."""
+    used = set(Tag.objects.exclude(bit=None).values_list('bit', flat=True))
+    return next(
+        (bit for bit in range(MAX_TAG_BITS) if bit not in used), None
+    )
+
+
+def assign_bit(tag_id):
+    """Даёт тегу младший свободный бит. Если этот бит одновременно занял
+    другой тег, уникальный индекс отклонит запись, и берётся следующий
+    свободный. Возвращает False, если свободных битов нет."""
+    for _ in range(MAX_TAG_BITS):
+        bit = next_free_bit()
+        if bit is None:
+            return False
+        try:
+            with transaction.atomic():
+                Tag.objects.filter(pk=tag_id, bit=None).update(bit=bit)
+        except IntegrityError:
+            continue
+        return True
+    return False
+
+
+@transaction.atomic
+def assign_free_bits():
+    """Раздаёт свободные биты тегам без бита, начиная со старых,
+    и пересчитывает маски их рецептов."""
+    assigned = []
+    tag_ids = Tag.objects.filter(bit=None).order_by('pk').values_list(
+        'pk', flat=True
+    )
+    for tag_id in tag_ids:
+        if not assign_bit(tag_id):
+            break
+        assigned.append(tag_id)
+    if assigned:
+        update_tags_mask(Recipe.tags.through.objects.filter(
+            tag_id__in=assigned
+        ).values_list('recipe_id', flat=True))
+
+
+def tags_mask(tags):
+    """Маска набора тегов или None, если у какого-то тега нет бита."""
+    mask = 0
+    for tag in tags:
+        if tag.bit is None:
+            return None
+        mask |= 1 << tag.bit
+    return mask
+
+
+def update_tags_mask(recipe_ids):
+    """Пересчитывает маски рецептов по их текущим тегам."""
+    masks = dict.fromkeys(recipe_ids, 0)
+    rows = Recipe.tags.through.objects.filter(
+        recipe_id__in=masks, tag__bit__isnull=False
+    ).values_list('recipe_id', 'tag__bit')
+    for recipe_id, bit in rows:
+        masks[recipe_id] |= 1 << bit
+    recipes_by_mask = defaultdict(list)
+    for recipe_id, mask in masks.items():
+        recipes_by_mask[mask].append(recipe_id)
+    for mask, ids in recipes_by_mask.items():
+        Recipe.objects.filter(pk__in=ids).update(tags_mask=mask)
+
+
+def clear_tag_bit(tag):
+    """Снимает бит тега с масок всех его рецептов."""
+    if tag.bit is None:
+        return
+    Recipe.objects.filter(tags=tag).update(
+        tags_mask=F('tags_mask').bitand(~(1 << tag.bit))
+    )
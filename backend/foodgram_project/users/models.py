@@ -29,8 +29,23 @@ class User(AbstractUser):
         max_length=FIELDS_USER_MAX_LENGTH,
         verbose_name='Фамилия',
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество подписчиков',
+    )
 
     class Meta:
+        indexes = [
+            models.Index(
+                fields=('-date_joined', '-id'), name='user_date_joined_id_idx'
+            ),
+        ]
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
 